@@ -3,22 +3,35 @@ FastAPI server for the YouTube Auto Clipper pipeline.
 n8n calls these endpoints to orchestrate the workflow.
 """
 
+import asyncio
+import hashlib
+import multiprocessing as mp
 import os
+import queue
+import re
+import sqlite3
 import threading
+import time
 import traceback
 import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+import orjson
 import uvicorn
+from anyio import to_thread
 from fastapi import FastAPI, Depends, HTTPException, Header
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.types import Receive, Scope, Send
 
-from config import OUTPUT_DIR, API_SECRET, CHANNEL_IDS, DB_PATH
-from downloader import check_new_videos, mark_processed, get_latest_video_from_channel, load_processed
-from main import process_video
+from config import OUTPUT_DIR, API_SECRET, CHANNEL_IDS, CHANNEL_ID_RE, DB_PATH, JOBS_DB_PATH
+from downloader import check_new_videos_async, mark_processed, get_latest_video_from_channel_async, load_processed, purge_files
+from main import Step, process_video, step_label
 
-app = FastAPI(title="YouTube Auto Clipper API")
+app = FastAPI(title="YouTube Auto Clipper API", default_response_class=ORJSONResponse)
 
 # ── Auth ────────────────────────────────────────────────────
 async def verify_auth(authorization: str = Header(None)):
@@ -27,8 +40,265 @@ async def verify_auth(authorization: str = Header(None)):
             raise HTTPException(401, "Unauthorized")
 
 
+# ── Zero-copy file responses ────────────────────────────────
+class SendFileResponse(FileResponse):
+    """FileResponse that lets the server sendfile(2) the clip when it supports that.
+
+    Uses the ASGI "http.response.zerocopysend" extension if the server offers it, so
+    file pages never pass through userspace. uvicorn (what start.sh runs) does not, so
+    there this is FileResponse streaming with larger 2 MiB reads: fewer read/send
+    round trips, but still a copy through userspace.
+    """
+    chunk_size = 2 * 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # download_file already served any valid Range; one that got here is invalid and
+        # ignored, so keep FileResponse from answering it with a 400
+        scope = {**scope, "headers": [(k, v) for k, v in scope.get("headers", []) if k != b"range"]}
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" not in extensions or scope.get("method") == "HEAD":
+            await super().__call__(scope, receive, send)
+            return
+
+        with open(self.path, "rb") as f:
+            stat_result = os.fstat(f.fileno())
+            self.set_stat_headers(stat_result)
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": f,
+                "offset": 0,
+                "count": stat_result.st_size,
+                "more_body": False,
+            })
+        if self.background is not None:
+            await self.background()
+
+
+class _OpenFile:
+    """A cached read-only fd for one clip, plus the identity it was opened against."""
+    __slots__ = ("fd", "ino", "mtime_ns", "users", "retired")
+
+    def __init__(self, fd: int, st: os.stat_result):
+        self.fd = fd
+        self.ino = st.st_ino
+        self.mtime_ns = st.st_mtime_ns
+        self.users = 0
+        self.retired = False
+
+
+class _FdCache:
+    """LRU of open clip fds so repeated Range requests don't re-open the file.
+
+    Entries are reference-counted: an evicted or replaced fd is only closed once
+    the last in-flight read has released it.
+    """
+
+    def __init__(self, size: int = 8):
+        self.size = size
+        self._entries: OrderedDict[str, _OpenFile] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, path: str) -> _OpenFile:
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and (entry.ino, entry.mtime_ns) == (st.st_ino, st.st_mtime_ns):
+                self._entries.move_to_end(path)
+            else:
+                if entry:
+                    self._retire(path)
+                entry = self._entries[path] = _OpenFile(os.open(path, os.O_RDONLY), st)
+                while len(self._entries) > self.size:
+                    self._retire(next(iter(self._entries)))
+            entry.users += 1
+            return entry
+
+    def release(self, entry: _OpenFile):
+        with self._lock:
+            entry.users -= 1
+            if entry.retired and entry.users == 0:
+                os.close(entry.fd)
+
+    def clear(self):
+        """Drop every cached fd, e.g. after the clips were deleted, so their disk space is freed."""
+        with self._lock:
+            for path in list(self._entries):
+                self._retire(path)
+
+    def _retire(self, path: str):
+        entry = self._entries.pop(path)
+        entry.retired = True
+        if entry.users == 0:
+            os.close(entry.fd)
+
+
+_fds = _FdCache()
+RANGE_CHUNK = 1 << 20   # 1 MiB preads, matching typical socket send buffers
+
+
+_RANGE_RE = re.compile(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", re.ASCII)
+
+
+class RangeNotSatisfiable(ValueError):
+    """A well-formed range that lies entirely past the end of the file (416)."""
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single 'bytes=start-end' range into inclusive offsets.
+
+    Returns None for a malformed or multi-range header, which RFC 9110 says to ignore
+    (serve the whole file, 200); raises RangeNotSatisfiable for a valid range past EOF.
+    """
+    m = _RANGE_RE.fullmatch(header)
+    if not m or not any(m.groups()):
+        return None
+    first, last = m.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(header)
+        start, end = max(size - suffix, 0), size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+async def _read_range(path: str, start: int, end: int):
+    """Yield bytes [start, end] of `path` via pread on a cached fd, off the event loop."""
+    entry = _fds.acquire(path)
+    try:
+        pos = start
+        while pos <= end:
+            chunk = await to_thread.run_sync(os.pread, entry.fd, min(RANGE_CHUNK, end - pos + 1), pos)
+            if not chunk:
+                break
+            yield chunk
+            pos += len(chunk)
+    finally:
+        _fds.release(entry)
+
+
 # ── Job tracking (async pattern for long processing) ────────
-jobs: dict[str, dict] = {}
+class JobStore:
+    """Jobs table in SQLite (WAL): one lock-guarded writer plus a small pool of readers.
+
+    Survives restarts and keeps RSS flat.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            progress INTEGER NOT NULL DEFAULT 0,
+            current_step TEXT,
+            clips TEXT NOT NULL DEFAULT '[]',
+            error TEXT,
+            created REAL NOT NULL
+        )
+    """
+
+    def __init__(self, path: Path, readers: int = 4):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._readers: queue.Queue = queue.Queue(maxsize=readers)
+        self._reader_slots = threading.Semaphore(readers)
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        if readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _writer_conn(self) -> sqlite3.Connection:
+        """Return the writer connection, creating the schema on first use. Caller holds the lock."""
+        if self._writer is None:
+            self._writer = self._connect()
+            self._writer.execute(self.SCHEMA)
+        return self._writer
+
+    def _write(self, sql: str, params: tuple = ()):
+        with self._write_lock:
+            conn = self._writer_conn()
+            conn.execute(sql, params)
+            conn.commit()
+
+    def _read(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        if self._writer is None:
+            self._write("SELECT 1")  # creates the file + schema before read-only opens
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(readonly=True)
+            try:
+                return conn.execute(sql, params).fetchall()
+            finally:
+                self._readers.put(conn)
+
+    def put(self, job_id: str, job: dict):
+        self._write(
+            "INSERT INTO jobs (id, status, progress, current_step, clips, error, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET status=excluded.status, progress=excluded.progress, "
+            "current_step=excluded.current_step, clips=excluded.clips, error=excluded.error",
+            (job_id, job["status"], job.get("progress", 0), job.get("current_step"),
+             orjson.dumps(job.get("clips", [])).decode(), job.get("error"), time.time()),
+        )
+
+    def get(self, job_id: str) -> dict | None:
+        rows = self._read(
+            "SELECT status, progress, current_step, clips, error FROM jobs WHERE id=?", (job_id,)
+        )
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["clips"] = orjson.loads(job["clips"])
+        return job
+
+    def prune(self, keep: int):
+        """Drop all but the newest `keep` jobs."""
+        self._write(
+            "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY created DESC LIMIT ?)",
+            (keep,),
+        )
+
+    def fail_interrupted(self):
+        """Mark jobs left 'processing' by a previous server run as failed."""
+        self._write(
+            "UPDATE jobs SET status='failed', error='Interrupted by server restart' WHERE status='processing'"
+        )
+
+    def clear(self):
+        self._write("DELETE FROM jobs")
+
+
+# The pipeline runs in a single-worker process pool so ffmpeg/yt-dlp/LLM work never
+# holds the API process's GIL. Live progress of the running job is three shared
+# ints (percent, Step code, clip number) the worker writes and pollers read lock-free;
+# the job store only sees the start and final state.
+jobs = JobStore(JOBS_DB_PATH)
+outstanding: dict[str, Future] = {}
+# _finalize runs on the pool's management thread while endpoints iterate `outstanding`
+_outstanding_lock = threading.Lock()
+executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_progress = _step = _clip = None
 
 
 class ProcessRequest(BaseModel):
@@ -36,48 +306,100 @@ class ProcessRequest(BaseModel):
     title: str = "Video"
 
 
-def _run_job(job_id: str, url: str, title: str):
-    """Background worker that runs the pipeline and updates job status."""
+_mp_context = mp.get_context("forkserver")
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=1, mp_context=_mp_context,
+        initializer=_init_worker, initargs=(_progress, _step, _clip),
+    )
 
-    def progress_callback(percent: int, step: str):
-        """Update job progress."""
-        jobs[job_id]["progress"] = percent
-        jobs[job_id]["current_step"] = step
 
+def _replace_broken_executor(broken: ProcessPoolExecutor):
+    """Swap in a fresh pool after a worker died (OOM kill, segfault); a broken pool never recovers."""
+    global executor
+    with _executor_lock:
+        if executor is broken:
+            print("[API] Pipeline worker died, starting a new process pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            executor = _new_executor()
+
+
+@app.on_event("startup")
+def _start_executor():
+    global executor, _progress, _step, _clip
+    jobs.fail_interrupted()
+    _progress, _step, _clip = (_mp_context.RawValue("i", 0), _mp_context.RawValue("i", 0),
+                               _mp_context.RawValue("i", 0))
+    executor = _new_executor()
+
+
+def _init_worker(progress, step, clip):
+    """Pool initializer: shared progress counters arrive by inheritance."""
+    global _progress, _step, _clip
+    _progress, _step, _clip = progress, step, clip
+
+
+@app.on_event("startup")
+async def _limit_threadpool():
+    # Only one pipeline runs at a time, so anyio's default 40 threads just cost stacks + scheduling
+    to_thread.current_default_thread_limiter().total_tokens = min(4, os.cpu_count() or 1)
+
+
+@app.on_event("shutdown")
+def _stop_executor():
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_job_worker(job_id: str, url: str, title: str) -> list[dict]:
+    """Pool worker that runs the pipeline and returns the clip list for the job."""
+
+    def progress_callback(percent: int, step: Step, clip_num: int):
+        """Update job progress."""
+        _progress.value = percent
+        _step.value = step
+        _clip.value = clip_num
+
+    result = process_video(url, title, progress_callback=progress_callback)
+    clips = []
+    for i, file_path in enumerate(result["files"]):
+        meta = result["clips_metadata"][i] if i < len(result["clips_metadata"]) else {}
+        clips.append({
+            "filename": file_path.name,
+            "download_url": f"/download/{file_path.name}",
+            "title": meta.get("title", f"Clip {i+1}"),
+            "description": meta.get("description", ""),
+            "tags": meta.get("tags", []),
+            "hook": meta.get("hook", ""),
+        })
+    return clips
+
+
+def _finalize(job_id: str, future: Future, pool: ProcessPoolExecutor):
+    """Record the outcome of a finished pool job."""
     try:
-        result = process_video(url, title, progress_callback=progress_callback)
-        clips = []
-        for i, file_path in enumerate(result["files"]):
-            meta = result["clips_metadata"][i] if i < len(result["clips_metadata"]) else {}
-            clips.append({
-                "filename": file_path.name,
-                "download_url": f"/download/{file_path.name}",
-                "title": meta.get("title", f"Clip {i+1}"),
-                "description": meta.get("description", ""),
-                "tags": meta.get("tags", []),
-                "hook": meta.get("hook", ""),
-            })
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["progress"] = 100
-        jobs[job_id]["current_step"] = "Done!"
-        jobs[job_id]["clips"] = clips
+        clips = future.result()
+        jobs.put(job_id, {"status": "completed", "progress": 100, "current_step": "Done!", "clips": clips})
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
+        if isinstance(e, BrokenProcessPool):
+            _replace_broken_executor(pool)
+        jobs.put(job_id, {
+            "status": "failed",
+            "progress": _progress.value,
+            "current_step": step_label(_step.value, _clip.value),
+            "error": str(e),
+        })
         print(f"[JOB {job_id}] FAILED: {e}")
-        traceback.print_exc()
+        traceback.print_exception(e)
+    with _outstanding_lock:
+        outstanding.pop(job_id, None)
 
 
 # ── Endpoints ───────────────────────────────────────────────
 
-from fastapi.responses import FileResponse, HTMLResponse
-
-# ... (rest of imports)
-
-@app.get("/", response_class=HTMLResponse)
-@app.head("/")
-async def root():
-    return """
+_ROOT_HTML = """
     <!DOCTYPE html>
     <html>
         <head>
@@ -110,6 +432,27 @@ async def root():
         </body>
     </html>
     """
+# Encoded once; every hit reuses the same bytes and validators
+_ROOT_BYTES = _ROOT_HTML.encode("utf-8")
+_ROOT_ETAG = f'"{hashlib.blake2b(_ROOT_BYTES, digest_size=8).hexdigest()}"'  # changes with the page
+_ROOT_HEADERS = {"ETag": _ROOT_ETAG, "Cache-Control": "public, max-age=3600"}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check: "*", or any listed tag equal to `etag` (weak comparison, W/ ignored)."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@app.get("/", response_class=HTMLResponse)
+@app.head("/")
+async def root(if_none_match: str | None = Header(None)):
+    if if_none_match and _etag_matches(if_none_match, _ROOT_ETAG):
+        return Response(status_code=304, headers=_ROOT_HEADERS)
+    return Response(content=_ROOT_BYTES, media_type="text/html", headers=_ROOT_HEADERS)
 
 
 @app.get("/health")
@@ -117,46 +460,59 @@ async def health():
     return {"status": "ok"}
 
 
+async def _raw_ytdlp_test(channel_id: str) -> dict:
+    """Run the yt-dlp CLI against a channel without blocking the event loop."""
+    cmd = [
+        "yt-dlp",
+        "--flat-playlist",
+        "--playlist-items", "1",
+        "--print", "%(id)s|||%(title)s",
+        "--extractor-args", "youtube:player_client=web",
+        "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        f"https://www.youtube.com/channel/{channel_id}/videos",
+    ]
+    proc = None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        out, err = await asyncio.wait_for(proc.communicate(), 120)
+        return {
+            "returncode": proc.returncode,
+            "stdout": out.decode("utf-8", errors="replace")[:500],
+            "stderr": err.decode("utf-8", errors="replace")[:500],
+        }
+    except Exception as e:
+        if proc and proc.returncode is None:
+            proc.kill()
+        return {"error": repr(e)}
+
+
 @app.get("/debug")
-async def debug():
-    """Debug endpoint — shows config, channels, processed videos, and tests one RSS feed."""
+async def debug(force: bool = False):
+    """Debug endpoint — shows config, channels, processed videos, and tests one RSS feed.
+    Pass ?force=1 to bypass the channel lookup cache."""
     processed = load_processed()
 
-    # Test first channel with error capture
+    # Test first channel with error capture, alongside a raw yt-dlp run to see the actual error
     test_result = None
     test_error = None
-    if CHANNEL_IDS:
-        try:
-            test_result = get_latest_video_from_channel(CHANNEL_IDS[0])
-        except Exception as e:
-            test_error = str(e)
-
-    # Also try a raw yt-dlp test to see the actual error
     ytdlp_test = None
     if CHANNEL_IDS:
-        try:
-            import subprocess
-            cmd = [
-                "yt-dlp",
-                "--flat-playlist",
-                "--playlist-items", "1",
-                "--print", "%(id)s|||%(title)s",
-                "--extractor-args", "youtube:player_client=web",
-                "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                f"https://www.youtube.com/channel/{CHANNEL_IDS[0]}/videos",
-            ]
-            r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            ytdlp_test = {
-                "returncode": r.returncode,
-                "stdout": r.stdout[:500],
-                "stderr": r.stderr[:500],
-            }
-        except Exception as e:
-            ytdlp_test = {"error": str(e)}
+        lookup, ytdlp_test = await asyncio.gather(
+            get_latest_video_from_channel_async(CHANNEL_IDS[0], force=force),
+            _raw_ytdlp_test(CHANNEL_IDS[0]),
+            return_exceptions=True,
+        )
+        if isinstance(lookup, Exception):
+            test_error = str(lookup)
+        else:
+            test_result = lookup
 
     return {
         "channels_configured": len(CHANNEL_IDS),
         "channel_ids": CHANNEL_IDS,
+        "channel_id_pattern": CHANNEL_ID_RE.pattern,
         "processed_count": len(processed),
         "processed_ids": processed[-10:],
         "db_path": str(DB_PATH),
@@ -170,7 +526,7 @@ async def debug():
 @app.get("/check-channels", dependencies=[Depends(verify_auth)])
 async def check_channels():
     """Return list of new (unprocessed) videos from monitored channels."""
-    new_videos = check_new_videos()
+    new_videos = await check_new_videos_async()
     return {"videos": new_videos}
 
 
@@ -185,27 +541,35 @@ async def start_processing(req: ProcessRequest):
         raise HTTPException(400, f"Invalid URL format: {req.url}")
 
     # Check if another job is already running
-    running = [j for j in jobs.values() if j["status"] == "processing"]
-    if running:
+    with _outstanding_lock:
+        busy = any(not f.done() for f in outstanding.values())
+    if busy:
         raise HTTPException(409, "Another job is already running. Wait for it to finish.")
 
     job_id = str(uuid.uuid4())[:8]
     
-    # Simple cleanup of old jobs to prevent memory growth
-    if len(jobs) > 20:
-        oldest_job = next(iter(jobs))
-        del jobs[oldest_job]
+    # Keep the job table small
+    jobs.prune(keep=20)
+    _progress.value, _step.value, _clip.value = 0, Step.STARTING, 0
 
-    jobs[job_id] = {
+    jobs.put(job_id, {
         "status": "processing",
         "progress": 0,
         "current_step": "Starting...",
         "clips": [],
         "error": None
-    }
+    })
 
-    thread = threading.Thread(target=_run_job, args=(job_id, req.url.strip(), req.title.strip()), daemon=True)
-    thread.start()
+    pool = executor
+    try:
+        future = pool.submit(_run_job_worker, job_id, req.url.strip(), req.title.strip())
+    except BrokenProcessPool:
+        _replace_broken_executor(pool)
+        pool = executor
+        future = pool.submit(_run_job_worker, job_id, req.url.strip(), req.title.strip())
+    with _outstanding_lock:
+        outstanding[job_id] = future
+    future.add_done_callback(lambda f: _finalize(job_id, f, pool))
 
     return {"job_id": job_id, "status": "processing", "progress": 0}
 
@@ -213,9 +577,13 @@ async def start_processing(req: ProcessRequest):
 @app.get("/job/{job_id}", dependencies=[Depends(verify_auth)])
 async def get_job(job_id: str):
     """Poll job status. Returns clips when completed."""
-    if job_id not in jobs:
+    job = jobs.get(job_id)
+    if job is None:
         raise HTTPException(404, "Job not found")
-    return jobs[job_id]
+    if job["status"] == "processing" and job_id in outstanding:
+        job["progress"] = _progress.value
+        job["current_step"] = step_label(_step.value, _clip.value)
+    return job
 
 
 @app.post("/mark-processed", dependencies=[Depends(verify_auth)])
@@ -226,26 +594,46 @@ async def mark_video_processed(video_id: str):
 
 
 @app.get("/download/{filename}", dependencies=[Depends(verify_auth)])
-async def download_file(filename: str):
-    """Download a generated clip file."""
+async def download_file(filename: str, range_header: str | None = Header(None, alias="range")):
+    """Download a generated clip file. Honors single-range 'Range: bytes=' requests (206)."""
     # Prevent path traversal
     safe_name = Path(filename).name
     path = OUTPUT_DIR / safe_name
     if not path.exists():
         raise HTTPException(404, "File not found")
-    return FileResponse(str(path), media_type="video/mp4", filename=safe_name)
+
+    span = None
+    if range_header:
+        size = path.stat().st_size
+        try:
+            span = _parse_range(range_header, size)  # None: invalid header, ignored
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if span:
+        start, end = span
+        return StreamingResponse(
+            _read_range(str(path), start, end),
+            status_code=206,
+            media_type="video/mp4",
+            headers={
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Accept-Ranges": "bytes",
+                "Content-Disposition": f'attachment; filename="{safe_name}"',
+            },
+        )
+
+    return SendFileResponse(
+        str(path), media_type="video/mp4", filename=safe_name, headers={"Accept-Ranges": "bytes"}
+    )
 
 
 @app.post("/cleanup", dependencies=[Depends(verify_auth)])
 async def cleanup():
     """Delete all output files to free disk space."""
-    count = 0
-    for f in OUTPUT_DIR.glob("*.mp4"):
-        try:
-            f.unlink()
-            count += 1
-        except Exception:
-            pass
+    count = purge_files(OUTPUT_DIR, (".mp4",))
+    _fds.clear()  # An open fd keeps a deleted clip's blocks allocated
     jobs.clear()
     return {"status": "cleaned", "files_deleted": count}
 
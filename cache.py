@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import AI_CACHE_ENABLED, AI_CACHE_MAX_MEMORY, AI_CACHE_PATH, AI_CACHE_TTL
+
+# ── AI Response Cache ───────────────────────────────────────
+# Identical prompts / audio hit the same key; memory LRU in front of a sqlite file
+_memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+
+# Sampling above this is treated as non-deterministic and not cached
+MAX_CACHEABLE_TEMPERATURE = 0.3
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(AI_CACHE_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+    return _conn
+
+
+def make_key(**parts) -> str:
+    """SHA-256 over the canonical JSON of the request parts (model, prompt, temp, ...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form for near-duplicate prompts: case-folded, whitespace runs collapsed."""
+    return " ".join(prompt.casefold().split())
+
+
+def audio_key(audio: bytes, model: str) -> str:
+    """Transcription key: content hash of the audio plus the model that transcribes it."""
+    return hashlib.sha256(audio).hexdigest() + ":" + model
+
+
+def cacheable(temperature: float | None, force_cache: bool = False) -> bool:
+    """Only near-deterministic calls are worth replaying, unless the caller insists."""
+    if not AI_CACHE_ENABLED:
+        return False
+    return force_cache or (temperature is not None and temperature <= MAX_CACHEABLE_TEMPERATURE)
+
+
+def get(key: str) -> str | None:
+    """Return the cached value for `key`, or None on a miss / expired entry."""
+    if not AI_CACHE_ENABLED:
+        return None
+    now = time.time()
+    with _lock:
+        hit = _memory.get(key)
+        if hit and hit[0] > now:
+            _memory.move_to_end(key)
+            return hit[1]
+        row = _db().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if not row or row[1] <= now:
+            return None
+        _remember(key, row[1], row[0])
+        return row[0]
+
+
+def set(key: str, value: str, ttl: float = AI_CACHE_TTL):
+    """Store `value` under `key` in memory and on disk for `ttl` seconds."""
+    if not AI_CACHE_ENABLED:
+        return
+    expires = time.time() + ttl
+    with _lock:
+        _remember(key, expires, value)
+        _db().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+            (key, value, expires),
+        )
+
+
+def _remember(key: str, expires: float, value: str):
+    _memory[key] = (expires, value)
+    _memory.move_to_end(key)
+    while len(_memory) > AI_CACHE_MAX_MEMORY:
+        _memory.popitem(last=False)
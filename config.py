@@ -1,4 +1,6 @@
 import os
+import re
+import shutil
 from pathlib import Path
 
 # ── Gemini API ──────────────────────────────────────────────
@@ -8,16 +10,59 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 # ── Groq API ────────────────────────────────────────────────
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = "llama-3.3-70b-versatile"
+# Short, formulaic generations (YouTube metadata) don't need the 70B model
+GROQ_MODEL_LITE = "llama-3.1-8b-instant"
 WHISPER_MODEL = "whisper-large-v3"
+# Long audio is transcribed as concurrent chunks of this length (+ overlap, seconds)
+TRANSCRIBE_CHUNK_SECONDS = 300
+TRANSCRIBE_CHUNK_OVERLAP = 2
 
 # Use the strongest free model
 GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_MODEL_LITE = "gemini-2.0-flash-lite"
+
+# Preferred LLM provider: "auto" (Groq), "groq", "gemini"; other keyed providers are failover
+AI_BACKEND = os.getenv("AI_BACKEND", "auto").lower()
+
+# Max concurrent LLM requests when per-clip calls are fanned out
+LLM_CONCURRENCY = 8
+# Rate-limited (429) / 5xx API calls are retried with backoff, each wait capped (seconds)
+LLM_MAX_RETRIES = 5
+LLM_MAX_BACKOFF = 32
+# Transcript tokens sent in one clip-selection prompt (Groq's 12K TPM minus the instructions)
+TRANSCRIPT_TOKEN_BUDGET = 8000
+# Transcripts too long for one prompt are shortlisted per window, then reduced
+MAPREDUCE_WINDOW_CHARS = 8000
+MAPREDUCE_CANDIDATES = 5
+# Clips whose metadata is requested together in one prompt
+METADATA_BATCH_SIZE = 8
+
+# Replay identical AI requests (transcripts, low-temperature prompts) from cache
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_TTL = 7 * 24 * 3600       # Seconds a cached response stays valid
+AI_CACHE_MAX_MEMORY = 256          # Entries kept in the in-process LRU
+# Key prompts on a case/whitespace-normalised form so trivially different prompts share an entry
+AI_CACHE_NORMALIZE = os.getenv("AI_CACHE_NORMALIZE", "false").lower() == "true"
+# Metadata samples hot (0.8) but the same clip title/hook/video deserves the same answer
+AI_CACHE_METADATA = os.getenv("AI_CACHE_METADATA", "true").lower() == "true"
+# Replay clip selection for an identical transcript too (reruns during development); off
+# by default so a fresh run can still pick different moments
+AI_CACHE_CLIPS = os.getenv("AI_CACHE_CLIPS", "false").lower() == "true"
 
 # ── YouTube Channels to Monitor ─────────────────────────────
 # Stored as HF Space secret "CHANNEL_IDS" (comma-separated)
 # Example: "UCxxxxxx,UCyyyyyy,UCzzzzzz"
 _raw_channels = os.getenv("CHANNEL_IDS", "")
-CHANNEL_IDS = [c.strip() for c in _raw_channels.split(",") if c.strip()]
+# Malformed IDs would otherwise cost a full yt-dlp timeout on every check
+CHANNEL_ID_RE = re.compile(r"^UC[A-Za-z0-9_-]{22}$")
+_channels = [c.strip() for c in _raw_channels.split(",") if c.strip()]
+CHANNEL_IDS = [c for c in _channels if CHANNEL_ID_RE.match(c)]
+if len(CHANNEL_IDS) != len(_channels):
+    print(f"[CONFIG] Ignoring {len(_channels) - len(CHANNEL_IDS)} malformed channel ID(s): "
+          f"{[c for c in _channels if not CHANNEL_ID_RE.match(c)]}")
+CHANNEL_CACHE_TTL = 300   # Seconds to reuse a channel's latest-video lookup
+# Async RSS fallback with ETag/If-Modified-Since over a shared HTTP/2 client
+RSS_CONDITIONAL_GET = os.getenv("RSS_CONDITIONAL_GET", "false").lower() == "true"
 
 # ── API Auth ────────────────────────────────────────────────
 # Shared secret between n8n and this API — set as HF Space secret
@@ -27,16 +72,30 @@ API_SECRET = os.getenv("API_SECRET", "")
 NUM_CLIPS = 1
 CLIP_MIN_SECONDS = 30
 CLIP_MAX_SECONDS = 60    # Max 60 seconds per clip
+# Clips of one video rendered at once (each ffmpeg encode already uses several cores)
+CLIP_WORKERS = 3
+# Threads per ffmpeg so concurrent clip encodes share the cores instead of oversubscribing
+# them (x264 scales poorly past a handful of threads anyway); a lone clip gets every core
+FFMPEG_THREADS = max(1, (os.cpu_count() or 4) // max(1, min(NUM_CLIPS, CLIP_WORKERS)))
+
+# ── Voiceover (edge-tts) ───────────────────────────────────
+TTS_VOICE = os.getenv("TTS_VOICE", "en-US-GuyNeural")
 
 # ── Background Music ───────────────────────────────────────
 # NCS / copyright-free playlist — a random track is picked each run
 MUSIC_PLAYLIST_URL = "https://www.youtube.com/watch?v=zeKCzmAKKP4&list=PLGBKsNyGY-afmc5ff3n1HOYGTmZO1xJGw"
 MUSIC_VOLUME = "0.10"    # Background music at 10% (subtle)
+MUSIC_POOL_SIZE = 5      # Downloaded tracks kept in music/; once full, runs pick from them offline
 
 # ── FFmpeg Quality ──────────────────────────────────────────
+# Resolved once so each of the many per-clip spawns skips the PATH search
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
 VIDEO_CODEC = "libx264"
 VIDEO_CRF = "23"
 VIDEO_PRESET = "faster"
+# "auto" probes for NVENC / VideoToolbox / QSV once and falls back to VIDEO_CODEC;
+# "off" always uses VIDEO_CODEC, or name a specific ffmpeg encoder
+VIDEO_HW_ENCODER = os.getenv("VIDEO_HW_ENCODER", "auto").lower()
 AUDIO_BITRATE = "192k"
 ORIGINAL_AUDIO_VOLUME = "0.8"
 
@@ -147,13 +206,53 @@ SUBTITLE_STYLES = {
 SELECTED_STYLE = "boxed"
 SUBTITLE_STYLE = SUBTITLE_STYLES[SELECTED_STYLE]
 
+
+
+def subtitle_force_style(style: dict) -> str:
+    """ffmpeg subtitles filter force_style string for a style preset."""
+    return (
+        f"FontName={style['font']},"
+        f"FontSize={style['font_size']},"
+        f"PrimaryColour={style['primary_color']},"
+        f"OutlineColour={style['outline_color']},"
+        f"BackColour={style['back_color']},"
+        f"BorderStyle=1,"
+        f"Outline={style['outline']},"
+        f"Shadow={style['shadow']},"
+        f"Bold={style['bold']},"
+        f"Alignment={style['alignment']},"
+        f"MarginV={style['margin_v']}"
+    )
+
+
+def subtitle_ass_style_line(style: dict) -> str:
+    """ASS [V4+ Styles] "Style: Default,..." line for a style preset."""
+    return (
+        f"Style: Default,{style['font']},{style['font_size']},{style['primary_color']},&H000000FF,"
+        f"{style['outline_color']},{style['back_color']},{-1 if style['bold'] else 0},0,0,0,100,100,0,0,"
+        f"1,{style['outline']},{style['shadow']},{style['alignment']},10,10,{style['margin_v']},1"
+    )
+
+
+# Rendered once at import so the per-clip subtitle path only injects ready strings
+SUBTITLE_FORCE_STYLE = subtitle_force_style(SUBTITLE_STYLE)
+SUBTITLE_STYLE_ASS_LINE = subtitle_ass_style_line(SUBTITLE_STYLE)
+
+# ── Transcripts ─────────────────────────────────────────────
+# Keep downloads/<id>_transcript.json so a rerun of the same video skips Whisper;
+# turn off on one-shot hosts to skip the write (and the read-back check)
+SAVE_TRANSCRIPT = os.getenv("SAVE_TRANSCRIPT", "true").lower() == "true"
+
 # ── Paths ───────────────────────────────────────────────────
 # HF Spaces writable dir is /tmp or the app directory
 BASE_DIR = Path(__file__).parent
 DOWNLOADS_DIR = BASE_DIR / "downloads"
 CLIPS_DIR = BASE_DIR / "clips"
 OUTPUT_DIR = BASE_DIR / "output"
-DB_PATH = BASE_DIR / "processed_videos.json"
+DB_PATH = BASE_DIR / "processed_videos.db"
+LEGACY_DB_PATH = BASE_DIR / "processed_videos.json"   # Migrated into DB_PATH on first use
+JOBS_DB_PATH = BASE_DIR / "jobs.db"
+AI_CACHE_PATH = BASE_DIR / "ai_cache.db"
 
 MUSIC_DIR = BASE_DIR / "music"
 MUSIC_LIBRARY_DIR = BASE_DIR / "music_library"
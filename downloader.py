@@ -1,91 +1,249 @@
+import asyncio
 import json
+import os
 import random
 import subprocess
-import shutil
+import threading
+import time
+import sqlite3
 import feedparser
+import httpx
+from xml.etree import ElementTree
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
 from datetime import date
+from functools import lru_cache
 from pathlib import Path
-from config import CHANNEL_IDS, DOWNLOADS_DIR, DB_PATH, MUSIC_DIR, MUSIC_LIBRARY_DIR, MUSIC_PLAYLIST_URL, BASE_DIR
-
-
-def load_processed():
-    """Load processed videos database. Returns dict with 'videos' list and 'last_processed_date'."""
-    if DB_PATH.exists():
-        data = json.loads(DB_PATH.read_text())
-        # Migrate old format (list) to new format (dict)
-        if isinstance(data, list):
-            return {"videos": data, "last_processed_date": None}
-        return data
-    return {"videos": [], "last_processed_date": None}
-
-
-def save_processed(data):
-    """Save processed videos database."""
-    DB_PATH.write_text(json.dumps(data))
+from config import CHANNEL_IDS, DOWNLOADS_DIR, DB_PATH, LEGACY_DB_PATH, MUSIC_DIR, MUSIC_LIBRARY_DIR, MUSIC_PLAYLIST_URL, BASE_DIR, CHANNEL_CACHE_TTL, RSS_CONDITIONAL_GET, MUSIC_POOL_SIZE, FFMPEG
+
+# ── Channel lookup cache ────────────────────────────────────
+# {channel_id: (expires_at, video)} — n8n polls far more often than channels upload
+_channel_cache: dict[str, tuple[float, dict | None]] = {}
+_channel_cache_lock = threading.Lock()
+# Cap concurrent async lookups to avoid YouTube IP throttling
+_channel_semaphore = asyncio.Semaphore(8)
+
+
+# ── yt-dlp ──────────────────────────────────────────────────
+_YDL_OPTS = {
+    "flat": {
+        "extract_flat": "in_playlist",
+        "skip_download": True,
+        "playlistend": 1,
+        "socket_timeout": 30,
+        "extractor_args": {"youtube": {"player_client": ["web"]}},
+        "http_headers": {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        },
+    },
+    "video": {
+        "format": "bestvideo[height<=720]+bestaudio/best[height<=720]",
+        "merge_output_format": "mp4",
+        "outtmpl": str(DOWNLOADS_DIR / "%(id)s.%(ext)s"),
+        "noplaylist": True,
+    },
+    "playlist": {
+        "extract_flat": "in_playlist",
+        "skip_download": True,
+    },
+    "music": {
+        "format": "bestaudio",
+        "outtmpl": str(MUSIC_DIR / "%(id)s.%(ext)s"),
+        "noplaylist": True,
+        "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "0"}],
+    },
+}
+_ydl_local = threading.local()
+
+
+# ── RSS (conditional GET) ───────────────────────────────────
+# One pooled HTTP/2 client for every feed, plus per-channel validators for 304s.
+_rss_etags: dict[str, str] = {}
+_rss_last_modified: dict[str, str] = {}
+_rss_videos: dict[str, dict] = {}
+_ATOM_NS = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015"}
+
+
+# ── Processed videos store ──────────────────────────────────
+# Append-only SQLite table: marking a video is one INSERT instead of rewriting a JSON list.
+_db_conn: sqlite3.Connection | None = None
+_db_lock = threading.Lock()
+# Loaded once on first lookup; channel polls then check membership without a query
+_processed_ids: set[str] | None = None
+
+
+def _db() -> sqlite3.Connection:
+    """Shared connection to the processed-videos database (created + migrated on first use)."""
+    global _db_conn
+    if _db_conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS processed (video_id TEXT PRIMARY KEY, ts INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        _migrate_legacy_db(conn)
+        _db_conn = conn
+    return _db_conn
+
+
+def _migrate_legacy_db(conn: sqlite3.Connection):
+    """Import the old processed_videos.json (list or dict format) once."""
+    if not LEGACY_DB_PATH.exists():
+        return
+    data = json.loads(LEGACY_DB_PATH.read_text())
+    if isinstance(data, list):
+        data = {"videos": data, "last_processed_date": None}
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO processed (video_id, ts) VALUES (?, ?)",
+            [(vid, i) for i, vid in enumerate(data.get("videos", []))],
+        )
+        if data.get("last_processed_date"):
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_processed_date', ?)",
+                (data["last_processed_date"],),
+            )
+    LEGACY_DB_PATH.rename(LEGACY_DB_PATH.with_suffix(".json.migrated"))
+    print(f"[DB] Migrated {len(data.get('videos', []))} processed videos from {LEGACY_DB_PATH.name}")
+
+
+def load_processed() -> list[str]:
+    """Return processed video IDs, oldest first."""
+    with _db_lock:
+        rows = _db().execute("SELECT video_id FROM processed ORDER BY ts, rowid").fetchall()
+    return [r[0] for r in rows]
+
+
+def is_processed(video_id: str) -> bool:
+    """Check whether a video was already processed.
+
+    Answered from the in-memory set; a miss is confirmed against the table in case
+    another process (CLI run, API) marked it since the set was loaded.
+    """
+    global _processed_ids
+    with _db_lock:
+        if _processed_ids is None:
+            _processed_ids = {r[0] for r in _db().execute("SELECT video_id FROM processed")}
+        if video_id in _processed_ids:
+            return True
+        row = _db().execute("SELECT 1 FROM processed WHERE video_id=? LIMIT 1", (video_id,)).fetchone()
+        if row is not None:
+            _processed_ids.add(video_id)
+    return row is not None
+
+
+def processed_count() -> int:
+    """Number of processed videos."""
+    with _db_lock:
+        return _db().execute("SELECT COUNT(*) FROM processed").fetchone()[0]
 
 
 def was_video_processed_today() -> bool:
     """Check if we already processed a video today."""
-    data = load_processed()
-    last_date = data.get("last_processed_date")
-    if last_date:
-        return last_date == str(date.today())
-    return False
+    with _db_lock:
+        row = _db().execute("SELECT value FROM meta WHERE key='last_processed_date'").fetchone()
+    return row is not None and row[0] == str(date.today())
 
 
 def mark_processed_today():
     """Update the last processed date to today."""
-    data = load_processed()
-    data["last_processed_date"] = str(date.today())
-    save_processed(data)
-
-
-def get_latest_video_from_channel(channel_id: str) -> dict | None:
-    """Fetch the most recent video from a YouTube channel.
-    Tries yt-dlp first (more reliable from cloud), falls back to RSS."""
+    with _db_lock, _db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_processed_date', ?)",
+            (str(date.today()),),
+        )
+
+
+def get_latest_video_from_channel(channel_id: str, force: bool = False) -> dict | None:
+    """Fetch the most recent video from a YouTube channel, cached for CHANNEL_CACHE_TTL seconds.
+    Pass force=True to bypass the cache."""
+    cached = None if force else _cached_channel(channel_id)
+    if cached:
+        return cached[1]
+    video = _fetch_latest_video(channel_id)
+    _cache_channel(channel_id, video)
+    return video
+
+
+async def get_latest_video_from_channel_async(channel_id: str, force: bool = False) -> dict | None:
+    """Async twin of get_latest_video_from_channel; shares the same cache."""
+    cached = None if force else _cached_channel(channel_id)
+    if cached:
+        return cached[1]
+    video = await _fetch_latest_video_async(channel_id)
+    _cache_channel(channel_id, video)
+    return video
+
+
+def _cached_channel(channel_id: str) -> tuple[float, dict | None] | None:
+    with _channel_cache_lock:
+        cached = _channel_cache.get(channel_id)
+    if cached and cached[0] > time.monotonic():
+        return cached
+    return None
 
-    # Check for cookies file to avoid rate limits
-    cookies_path = BASE_DIR / "cookies.txt"
-    cookies_args = ["--cookies", str(cookies_path)] if cookies_path.exists() else []
 
-    # Method 1: yt-dlp (works better from cloud IPs)
-    try:
-        channel_url = f"https://www.youtube.com/channel/{channel_id}/videos"
-        cmd = [
-            "yt-dlp",
-            *cookies_args,
-            "--js-runtimes", "node",
-            "--remote-components", "ejs:github",
-            "--flat-playlist",
-            "--playlist-items", "1",
-            "--print", "%(id)s",
-            "--print", "%(title)s",
-            "--print", "%(url)s",
-            "--no-warnings",
-            "--extractor-args", "youtube:player_client=web",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            channel_url,
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if result.returncode == 0 and result.stdout.strip():
-            lines = result.stdout.strip().split("\n")
-            if len(lines) >= 3:
-                video_id = lines[0].strip()
-                title = lines[1].strip()
-                url = lines[2].strip()
-                if not url.startswith("http"):
-                    url = f"https://www.youtube.com/watch?v={video_id}"
-                print(f"  [yt-dlp] Found: {title} ({video_id})")
-                return {
-                    "video_id": video_id,
-                    "title": title,
-                    "url": url,
-                    "published": "",
-                }
-    except Exception as e:
-        print(f"  [yt-dlp] Failed for {channel_id}: {e}")
-
-    # Method 2: RSS fallback
+def _cache_channel(channel_id: str, video: dict | None):
+    with _channel_cache_lock:
+        _channel_cache[channel_id] = (time.monotonic() + CHANNEL_CACHE_TTL, video)
+
+
+def _invalidate_channel_cache(video_id: str):
+    """Drop cached channel lookups that point at `video_id`."""
+    with _channel_cache_lock:
+        for channel_id, (_, video) in list(_channel_cache.items()):
+            if video and video["video_id"] == video_id:
+                del _channel_cache[channel_id]
+
+
+def _ydl(kind: str) -> YoutubeDL:
+    """Per-thread, reusable YoutubeDL instance for `kind` (see _YDL_OPTS).
+
+    Reusing the instance skips interpreter start-up, extractor imports and cookie
+    parsing on every call. YoutubeDL isn't reentrant, so each thread gets its own.
+    """
+    cache = _ydl_local.__dict__
+    if kind not in cache:
+        opts = {
+            "quiet": True,
+            "no_warnings": True,
+            "js_runtimes": {"node": {}},
+            "remote_components": {"ejs:github"},
+            **_YDL_OPTS[kind],
+        }
+        # Check for cookies file to avoid rate limits
+        cookies_path = BASE_DIR / "cookies.txt"
+        if cookies_path.exists():
+            opts["cookiefile"] = str(cookies_path)
+        cache[kind] = YoutubeDL(opts)
+    return cache[kind]
+
+
+def _extract_latest_video(channel_id: str) -> dict | None:
+    """Newest upload of a channel via a flat yt-dlp extraction."""
+    channel_url = f"https://www.youtube.com/channel/{channel_id}/videos"
+    info = _ydl("flat").extract_info(channel_url, download=False)
+    entries = list((info or {}).get("entries") or [])
+    if not entries:
+        return None
+    entry = entries[0]
+    video_id = entry["id"]
+    title = entry.get("title", "")
+    url = entry.get("url") or ""
+    if not url.startswith("http"):
+        url = f"https://www.youtube.com/watch?v={video_id}"
+    print(f"  [yt-dlp] Found: {title} ({video_id})")
+    return {
+        "video_id": video_id,
+        "title": title,
+        "url": url,
+        "published": "",
+    }
+
+
+def _fetch_latest_video_rss(channel_id: str) -> dict | None:
+    """RSS fallback for the newest upload of a channel."""
     try:
         feed_url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
         feed = feedparser.parse(feed_url)
@@ -102,29 +260,107 @@ def get_latest_video_from_channel(channel_id: str) -> dict | None:
             print(f"  [RSS] No entries for channel {channel_id}")
     except Exception as e:
         print(f"  [RSS] Failed for {channel_id}: {e}")
+    return None
+
+
+def _fetch_latest_video(channel_id: str) -> dict | None:
+    """Fetch the most recent video from a YouTube channel.
+    Tries yt-dlp first (more reliable from cloud), falls back to RSS."""
+
+    # Method 1: yt-dlp (works better from cloud IPs)
+    try:
+        video = _extract_latest_video(channel_id)
+        if video:
+            return video
+    except Exception as e:
+        print(f"  [yt-dlp] Failed for {channel_id}: {e}")
+
+    # Method 2: RSS fallback
+    video = _fetch_latest_video_rss(channel_id)
+    if video:
+        return video
 
     print(f"  [WARN] Could not fetch any video for channel {channel_id}")
     return None
 
 
-def check_new_videos() -> list[dict]:
-    """Check all monitored channels for new (unprocessed) videos. Returns max 1 video per day."""
-    # Check if we already processed a video today
-    if was_video_processed_today():
-        print("[CHECK] Already processed a video today. Limit: 1 video/day.")
-        return []
+async def _fetch_latest_video_async(channel_id: str) -> dict | None:
+    """Non-blocking _fetch_latest_video: yt-dlp in a worker thread, RSS over the shared async client."""
+    if not RSS_CONDITIONAL_GET:
+        async with _channel_semaphore:
+            return await asyncio.to_thread(_fetch_latest_video, channel_id)
 
-    print(f"[CHECK] Checking {len(CHANNEL_IDS)} channels...")
-    data = load_processed()
-    processed_ids = data.get("videos", [])
-    print(f"[CHECK] Already processed: {len(processed_ids)} videos total")
-    new_videos = []
+    async with _channel_semaphore:
+        try:
+            video = await asyncio.to_thread(_extract_latest_video, channel_id)
+            if video:
+                return video
+        except Exception as e:
+            print(f"  [yt-dlp] Failed for {channel_id}: {e}")
 
-    for channel_id in CHANNEL_IDS:
-        print(f"[CHECK] Checking channel: {channel_id}")
-        video = get_latest_video_from_channel(channel_id)
+        video = await _fetch_latest_video_rss_async(channel_id)
         if video:
-            if video["video_id"] not in processed_ids:
+            return video
+
+    print(f"  [WARN] Could not fetch any video for channel {channel_id}")
+    return None
+
+
+@lru_cache(maxsize=None)
+def _rss_client() -> httpx.AsyncClient:
+    """Shared HTTP/2 client for the feeds, built on first use so RSS_CONDITIONAL_GET=false never pays for it."""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    )
+
+
+async def _fetch_latest_video_rss_async(channel_id: str) -> dict | None:
+    """RSS fallback using conditional GET: an unchanged feed costs a bodiless 304."""
+    feed_url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
+    headers = {}
+    if channel_id in _rss_etags:
+        headers["If-None-Match"] = _rss_etags[channel_id]
+    if channel_id in _rss_last_modified:
+        headers["If-Modified-Since"] = _rss_last_modified[channel_id]
+
+    try:
+        resp = await _rss_client().get(feed_url, headers=headers)
+        if resp.status_code == 304 and channel_id in _rss_videos:
+            return _rss_videos[channel_id]
+        resp.raise_for_status()
+
+        root = ElementTree.fromstring(resp.content)
+        entry = root.find("atom:entry", _ATOM_NS)
+        if entry is None:
+            print(f"  [RSS] No entries for channel {channel_id}")
+            return None
+        video = {
+            "video_id": entry.findtext("yt:videoId", "", _ATOM_NS),
+            "title": entry.findtext("atom:title", "", _ATOM_NS),
+            "url": entry.find("atom:link", _ATOM_NS).get("href"),
+            "published": entry.findtext("atom:published", "", _ATOM_NS),
+        }
+        print(f"  [RSS] Found: {video['title']} ({video['video_id']})")
+    except Exception as e:
+        print(f"  [RSS] Failed for {channel_id}: {e!r}")
+        return None
+
+    _rss_videos[channel_id] = video
+    if "etag" in resp.headers:
+        _rss_etags[channel_id] = resp.headers["etag"]
+    if "last-modified" in resp.headers:
+        _rss_last_modified[channel_id] = resp.headers["last-modified"]
+    return video
+
+
+def _pick_new_video(videos: list[dict | None]) -> list[dict]:
+    """Filter out processed videos and pick one at random (daily limit)."""
+    new_videos = []
+    for video in videos:
+        if video:
+            if not is_processed(video["video_id"]):
                 print(f"  -> NEW: {video['title']}")
                 new_videos.append(video)
             else:
@@ -143,146 +379,196 @@ def check_new_videos() -> list[dict]:
     return []
 
 
+def check_new_videos() -> list[dict]:
+    """Check all monitored channels for new (unprocessed) videos. Returns max 1 video per day."""
+    # Check if we already processed a video today
+    if was_video_processed_today():
+        print("[CHECK] Already processed a video today. Limit: 1 video/day.")
+        return []
+
+    print(f"[CHECK] Checking {len(CHANNEL_IDS)} channels...")
+    print(f"[CHECK] Already processed: {processed_count()} videos total")
+
+    videos = []
+    for channel_id in CHANNEL_IDS:
+        print(f"[CHECK] Checking channel: {channel_id}")
+        videos.append(get_latest_video_from_channel(channel_id))
+
+    return _pick_new_video(videos)
+
+
+async def check_new_videos_async() -> list[dict]:
+    """Async check_new_videos: all channels are looked up concurrently."""
+    if was_video_processed_today():
+        print("[CHECK] Already processed a video today. Limit: 1 video/day.")
+        return []
+
+    print(f"[CHECK] Checking {len(CHANNEL_IDS)} channels concurrently...")
+    print(f"[CHECK] Already processed: {processed_count()} videos total")
+
+    videos = await asyncio.gather(*[get_latest_video_from_channel_async(c) for c in CHANNEL_IDS])
+    return _pick_new_video(videos)
+
+
 def mark_processed(video_id: str):
     """Mark a video as processed and update today's date."""
-    data = load_processed()
-    videos = data.get("videos", [])
-    videos.append(video_id)
-    data["videos"] = videos[-500:]  # Keep last 500
-    data["last_processed_date"] = str(date.today())
-    save_processed(data)
+    with _db_lock, _db() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO processed (video_id, ts) VALUES (?, strftime('%s','now'))",
+            (video_id,),
+        )
+        if _processed_ids is not None:
+            _processed_ids.add(video_id)
+    mark_processed_today()
+    _invalidate_channel_cache(video_id)
+
+
+def purge_files(directory: Path, exts: tuple[str, ...] | None = None) -> int:
+    """Delete regular files in `directory` (optionally only those ending in `exts`).
+
+    One scandir pass: DirEntry carries the file type from the directory read, so
+    there's no per-file stat or Path wrapping. Files that can't be removed are
+    skipped. Returns the number of files actually removed.
+    """
+    count = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and (exts is None or entry.name.endswith(exts)):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    continue  # Already gone, or still held open (Windows) — skip it
+                count += 1
+    return count
 
 
 def download_video(video_url: str) -> Path:
     """Download video using yt-dlp at best quality. Returns path to downloaded file."""
     # Clean old downloads first
-    for f in DOWNLOADS_DIR.glob("*.mp4"):
-        try:
-            f.unlink()
-        except Exception:
-            pass
+    purge_files(DOWNLOADS_DIR, (".mp4",))
 
-    output_template = str(DOWNLOADS_DIR / "%(id)s.%(ext)s")
-    
-    cookies_path = BASE_DIR / "cookies.txt"
-    cookies_args = ["--cookies", str(cookies_path)] if cookies_path.exists() else []
-
-    cmd = [
-        "yt-dlp",
-        *cookies_args,
-        "--js-runtimes", "node",
-        "--remote-components", "ejs:github",
-        "--format", "bestvideo[height<=720]+bestaudio/best[height<=720]",
-        "--merge-output-format", "mp4",
-        "--output", output_template,
-        "--no-playlist",
-        video_url,
-    ]
-
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"yt-dlp failed: {result.stderr}")
+    try:
+        info = _ydl("video").extract_info(video_url, download=True)
+    except DownloadError as e:
+        raise RuntimeError(f"yt-dlp failed: {e}")
 
-    for f in DOWNLOADS_DIR.glob("*.mp4"):
-        return f
+    # outtmpl is "<id>.<ext>" merged to mp4
+    path = DOWNLOADS_DIR / f"{info['id']}.mp4" if info else None
+    if path and path.exists():
+        return path
 
     raise FileNotFoundError("Downloaded video not found")
 
 
 def download_random_music() -> Path:
-    """Get a random track: prefer local library, fall back to YouTube download."""
-    
-    # 1. Try local library first
+    """Get a random track: prefer local library, then the pool of already-downloaded
+    tracks once it holds MUSIC_POOL_SIZE, else download one more from the playlist."""
+
+    # 1. Try local library first (ffmpeg reads it in place, no copy needed)
     if MUSIC_LIBRARY_DIR.exists():
         local_files = list(MUSIC_LIBRARY_DIR.glob("*.mp3"))
         if local_files:
             track = random.choice(local_files)
             print(f"[MUSIC] Using local track: {track.name}")
+            return track
 
-            # Prepare destination
-            for f in MUSIC_DIR.glob("*"):
-                try:
-                    f.unlink()
-                except Exception:
-                    pass
-            
-            dest = MUSIC_DIR / "bg_music.mp3"
-            shutil.copy(track, dest)
-            return dest
-
-    # 2. Fallback to YouTube download
+    # 2. Reuse a previously downloaded track: no playlist fetch, no download
+    pool = list(MUSIC_DIR.glob("*.mp3"))
+    if len(pool) >= MUSIC_POOL_SIZE:
+        track = random.choice(pool)
+        print(f"[MUSIC] Reusing downloaded track: {track.name} ({len(pool)} in pool)")
+        return track
+
+    # 3. Fallback to YouTube download, growing the pool
     print("[MUSIC] Fetching playlist info...")
 
-    cmd = [
-        "yt-dlp",
-        "--js-runtimes", "node",
-        "--remote-components", "ejs:github",
-        "--flat-playlist",
-        "--print", "url",
-        MUSIC_PLAYLIST_URL,
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"yt-dlp playlist fetch failed: {result.stderr}")
+    try:
+        playlist = _ydl("playlist").extract_info(MUSIC_PLAYLIST_URL, download=False)
+    except DownloadError as e:
+        raise RuntimeError(f"yt-dlp playlist fetch failed: {e}")
 
-    urls = [u.strip() for u in result.stdout.strip().split("\n") if u.strip()]
-    if not urls:
+    entries = [e for e in (playlist or {}).get("entries") or [] if e and e.get("url")]
+    if not entries:
         raise RuntimeError("No tracks found in music playlist")
 
-    track_url = random.choice(urls)
-    print(f"[MUSIC] Downloading random track from playlist ({len(urls)} tracks available)")
+    have = {p.stem for p in pool}
+    entry = random.choice([e for e in entries if e.get("id") not in have] or entries)
+    print(f"[MUSIC] Downloading random track from playlist ({len(entries)} tracks available)")
+
+    try:
+        info = _ydl("music").extract_info(entry["url"], download=True)
+    except DownloadError as e:
+        raise RuntimeError(f"yt-dlp music download failed: {e}")
 
-    output_template = str(MUSIC_DIR / "bg_music.%(ext)s")
+    # outtmpl "<id>.<ext>", converted to mp3 by the FFmpegExtractAudio postprocessor
+    track = MUSIC_DIR / f"{info['id']}.mp3" if info else None
+    if track and track.exists():
+        print(f"[MUSIC] Downloaded: {track.name}")
+        return track
 
-    for f in MUSIC_DIR.glob("*"):
-        try:
-            f.unlink()
-        except Exception:
-            pass
+    raise FileNotFoundError("Downloaded music file not found")
 
-    cmd = [
-        "yt-dlp",
-        "--js-runtimes", "node",
-        "--remote-components", "ejs:github",
-        "--format", "bestaudio",
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",
-        "--output", output_template,
-        "--no-playlist",
-        track_url,
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"yt-dlp music download failed: {result.stderr}")
 
-    for f in MUSIC_DIR.glob("*.mp3"):
-        print(f"[MUSIC] Downloaded: {f.name}")
-        return f
+# Constant bitrate of the transcription mp3, so its duration follows from its size
+TRANSCRIBE_AUDIO_BITRATE = 32_000
 
-    raise FileNotFoundError("Downloaded music file not found")
 
+def extract_audio(video_path: Path, pipe: bool = False) -> Path | bytes:
+    """Extract audio from video for transcription (compressed mp3 for API limits).
 
-def extract_audio(video_path: Path) -> Path:
-    """Extract audio from video for transcription (compressed mp3 for API limits)."""
+    With pipe=True the mp3 is read from ffmpeg's stdout and returned as bytes, so it
+    never touches the disk before being uploaded.
+    """
     audio_path = video_path.with_suffix(".mp3")
     
     # -t 1800 limits transcription to the first 30 minutes to stay under API limits
     # -ab 32k mono is very small but clear enough for Whisper
     cmd = [
-        "ffmpeg", "-y",
+        FFMPEG, "-y", "-hide_banner", "-loglevel", "error", "-nostats",
         "-i", str(video_path),
         "-vn",
         "-t", "1800",
         "-acodec", "libmp3lame",
-        "-ab", "32k",
+        "-ab", f"{TRANSCRIBE_AUDIO_BITRATE // 1000}k",
         "-ar", "16000",
         "-ac", "1",
-        str(audio_path),
     ]
-    subprocess.run(cmd, capture_output=True, check=True)
+    if pipe:
+        audio = subprocess.run([*cmd, "-f", "mp3", "pipe:1"], capture_output=True, check=True).stdout
+        print(f"[DOWNLOADER] Extracted audio: {len(audio) / (1024 * 1024):.2f} MB (in memory)")
+        return audio
+
+    subprocess.run([*cmd, str(audio_path)], capture_output=True, check=True)
     
     size_mb = audio_path.stat().st_size / (1024 * 1024)
     print(f"[DOWNLOADER] Extracted audio: {size_mb:.2f} MB")
     
     return audio_path
+
+
+def split_audio(audio: bytes, chunk_s: float, overlap_s: float = 0.0) -> list[tuple[float, bytes]]:
+    """Cut extract_audio(pipe=True) output into (offset_seconds, mp3_bytes) chunks.
+
+    Each chunk is chunk_s long plus overlap_s of the next one, stream-copied by ffmpeg
+    (no re-encode). Audio that fits in one chunk is returned as-is.
+    """
+    duration = len(audio) * 8 / TRANSCRIBE_AUDIO_BITRATE
+    if duration <= chunk_s + overlap_s:
+        return [(0.0, audio)]
+
+    chunks = []
+    offset = 0.0
+    while offset < duration:
+        cmd = [
+            FFMPEG, "-v", "error",
+            "-i", "pipe:0",
+            # Output-side seek: stdin can't be seeked, so ffmpeg reads up to the offset
+            "-ss", f"{offset:.3f}", "-t", f"{chunk_s + overlap_s:.3f}",
+            "-c", "copy", "-f", "mp3", "pipe:1",
+        ]
+        chunk = subprocess.run(cmd, input=audio, capture_output=True, check=True).stdout
+        if chunk:
+            chunks.append((offset, chunk))
+        offset += chunk_s
+    print(f"[DOWNLOADER] Split {duration:.0f}s of audio into {len(chunks)} chunks")
+    return chunks
@@ -1,72 +1,195 @@
-import json
+import asyncio
 import time
-import os
 import random
+import re
+import threading
+import uuid
+from functools import lru_cache
 from pathlib import Path
-from groq import Groq
-import google.generativeai as genai
-from config import GROQ_API_KEY, GROQ_MODEL, WHISPER_MODEL, NUM_CLIPS, CLIP_MIN_SECONDS, CLIP_MAX_SECONDS, GEMINI_API_KEY, GEMINI_MODEL
+from typing import TYPE_CHECKING, TypedDict
+import aiofiles
+import httpx
+import orjson
+import cache
+from config import (GROQ_API_KEY, GROQ_MODEL, WHISPER_MODEL, NUM_CLIPS, CLIP_MIN_SECONDS, CLIP_MAX_SECONDS,
+                    GEMINI_API_KEY, GEMINI_MODEL, LLM_CONCURRENCY, TRANSCRIBE_CHUNK_SECONDS,
+                    TRANSCRIBE_CHUNK_OVERLAP, AI_BACKEND, MAPREDUCE_WINDOW_CHARS,
+                    MAPREDUCE_CANDIDATES, AI_CACHE_NORMALIZE, METADATA_BATCH_SIZE,
+                    LLM_MAX_RETRIES, LLM_MAX_BACKOFF, AI_CACHE_METADATA,
+                    TRANSCRIPT_TOKEN_BUDGET, GROQ_MODEL_LITE, GEMINI_MODEL_LITE, AI_CACHE_CLIPS)
+from downloader import split_audio
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq, Groq
+
+# Provider SDKs are imported on first use: each pulls in tens of MB of
+# protobuf/grpc/httpx machinery that a Groq-only (or Gemini-only) run never needs.
+
+# ── HTTP ────────────────────────────────────────────────────
+# One pool settings for every Groq client: HTTP/2 multiplexes the concurrent
+# fan-out calls onto a single TLS session instead of one connection each.
+# (google-generativeai talks gRPC, which already multiplexes over one HTTP/2 channel.)
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)  # The Groq SDK's own default
+
+
+@lru_cache(maxsize=None)
+def _http_client() -> httpx.Client:
+    """Process-wide pooled HTTP/2 client shared by all sync API calls."""
+    print("[AI-HTTP] Shared HTTP/2 keep-alive pool ready")
+    return httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
 
 # ── Groq Client ─────────────────────────────────────────────
-groq_client = None
-if GROQ_API_KEY:
-    groq_client = Groq(api_key=GROQ_API_KEY)
-else:
+if not GROQ_API_KEY:
     print("[WARNING] GROQ_API_KEY not set — Groq features will fail.")
 
+
+@lru_cache(maxsize=None)
+def _groq() -> "Groq":
+    """Process-wide Groq client on the shared pool, so calls skip the TCP+TLS handshake."""
+    from groq import Groq
+    # max_retries=0: _call_with_retry owns backoff, SDK retries would multiply the attempts
+    return Groq(api_key=GROQ_API_KEY, http_client=_http_client(), max_retries=0)
+
+
+def _async_groq() -> "AsyncGroq":
+    """New AsyncGroq client; async clients bind to the running loop, so callers own and close it.
+
+    Its HTTP/2 transport carries the whole gathered batch over one connection.
+    """
+    from groq import AsyncGroq
+    http_client = httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+    return AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client, max_retries=0)
+
+
 # ── Gemini Client ───────────────────────────────────────────
-gemini_configured = False
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_configured = True
-else:
+if not GEMINI_API_KEY:
     print("[WARNING] GEMINI_API_KEY not set — Gemini features will fail.")
 
 
-def _get_provider() -> str:
-    """Select AI provider. Prefers Groq (faster, no quota issues), Gemini as fallback."""
-    if groq_client:
-        return "groq"
-    elif gemini_configured:
-        return "gemini"
-    else:
-        return "none"
+@lru_cache(maxsize=None)
+def _genai():
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
 
 
-def transcribe_audio(audio_path: Path) -> tuple[str, list[dict]]:
-    """Use Groq's Whisper-large-v3 to get a timestamped transcript + word timings.
+@lru_cache(maxsize=None)
+def _gemini_model(system_instruction: str, model_name: str = GEMINI_MODEL):
+    """One GenerativeModel per (system prompt, model), reused across calls instead of rebuilt each time."""
+    return _genai().GenerativeModel(model_name, system_instruction=system_instruction)
 
-    Returns:
-        (formatted_transcript, word_timings)
-        word_timings: [{"word": str, "start": float, "end": float}, ...]
+
+class LLMRouter:
+    """Orders the keyed LLM providers by health so every call fails over the same way.
+
+    Health is an EMA of call latency scaled up by an EMA of the error rate; the
+    AI_BACKEND preference wins ties, so a healthy preferred provider stays first.
     """
-    if not groq_client:
-        raise RuntimeError("GROQ_API_KEY required for transcription (Whisper).")
 
-    print(f"[AI-Groq] Transcribing audio with Whisper: {audio_path.name}")
+    def __init__(self, providers: list[str], alpha: float = 0.2):
+        self.providers = providers
+        self.alpha = alpha
+        self._latency = dict.fromkeys(providers, 0.0)
+        self._errors = dict.fromkeys(providers, 0.0)
+        self._lock = threading.Lock()
 
-    with open(audio_path, "rb") as file:
-        transcription = groq_client.audio.transcriptions.create(
-            file=(audio_path.name, file),
-            model=WHISPER_MODEL,
-            response_format="verbose_json",
-            timestamp_granularities=["word", "segment"],
-        )
+    def record(self, provider: str, ok: bool, latency: float):
+        a = self.alpha
+        with self._lock:
+            prev = self._latency[provider]
+            self._latency[provider] = latency if not prev else (1 - a) * prev + a * latency
+            self._errors[provider] = (1 - a) * self._errors[provider] + a * (0.0 if ok else 1.0)
 
-    # Format transcript with timestamps (for AI clip selection)
-    formatted_transcript = ""
-    for segment in transcription.segments:
-        start = segment['start']
-        end = segment['end']
-        text = segment['text']
-        start_str = f"{int(start // 60):02d}:{int(start % 60):02d}"
-        end_str = f"{int(end // 60):02d}:{int(end % 60):02d}"
-        formatted_transcript += f"[{start_str} - {end_str}] {text}\n"
+    def order(self) -> list[str]:
+        with self._lock:
+            # Untried providers are assumed as slow as the slowest known one
+            worst = max(self._latency.values(), default=0.0) or 1.0
+            score = {p: (self._latency[p] or worst) * (1 + 4 * self._errors[p]) for p in self.providers}
+        return sorted(self.providers, key=score.__getitem__)
+
+
+def _provider_preference() -> list[str]:
+    """Keyed providers, AI_BACKEND's choice first; "auto" prefers Groq (faster, no quota issues)."""
+    keyed = [p for p, key in (("groq", GROQ_API_KEY), ("gemini", GEMINI_API_KEY)) if key]
+    return sorted(keyed, key=lambda p: p != AI_BACKEND)
+
+
+_router = LLMRouter(_provider_preference())
+
+
+def _get_provider() -> str:
+    """The provider the router would try first right now."""
+    return next(iter(_router.order()), "none")
+
+
+def _retry_delay(e: Exception, attempt: int) -> float | None:
+    """Seconds to wait before retrying `e`, or None if it isn't a transient API error.
+
+    Rate limits (429) honour the server's retry-after header; 5xx errors back off
+    exponentially with jitter. Works off attributes rather than exception classes
+    so neither SDK has to be imported just to classify its errors.
+    """
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    if not isinstance(status, int) or not (status == 429 or 500 <= status < 600):
+        return None
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after")), LLM_MAX_BACKOFF)
+    except (TypeError, ValueError):
+        return min(2 ** attempt + random.random(), LLM_MAX_BACKOFF)
+
+
+def _call_with_retry(fn, *args, **kwargs):
+    """Call an SDK method, retrying rate-limit and server errors up to LLM_MAX_RETRIES times."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == LLM_MAX_RETRIES:
+                raise
+            print(f"[AI] API busy ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+async def _call_with_retry_async(fn, *args, **kwargs):
+    """Async _call_with_retry: awaits the call and sleeps without blocking the loop."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == LLM_MAX_RETRIES:
+                raise
+            print(f"[AI] API busy ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
+def _completion_key(model: str, system: str, prompt: str, temperature: float | None,
+                    force_cache: bool) -> str | None:
+    """Cache key for a JSON-mode completion, or None when the call shouldn't be cached."""
+    if not cache.cacheable(temperature, force_cache):
+        return None
+    if AI_CACHE_NORMALIZE:
+        prompt = cache.normalize_prompt(prompt)
+    return cache.make_key(model=model, system=system, prompt=prompt, temp=temperature, json=True)
+
+
+def _format_transcription(segments: list[dict], words: list[dict] | None) -> tuple[str, list[dict]]:
+    """Turn Whisper verbose_json segments/words into (formatted_transcript, word_timings)."""
+    # Format transcript with timestamps (for AI clip selection); one join instead of repeated +=
+    formatted_transcript = "".join(
+        f"[{int(s['start'] // 60):02d}:{int(s['start'] % 60):02d} - "
+        f"{int(s['end'] // 60):02d}:{int(s['end'] % 60):02d}] {s['text']}\n"
+        for s in segments
+    )
 
     # Extract word-level timings
     word_timings = []
-    if hasattr(transcription, 'words') and transcription.words:
-        for w in transcription.words:
+    if words:
+        for w in words:
             word_timings.append({
                 "word": w.get("word", w.get("text", "")),
                 "start": w.get("start", 0.0),
@@ -76,7 +199,7 @@ def transcribe_audio(audio_path: Path) -> tuple[str, list[dict]]:
     else:
         # Fallback: estimate word timings from segments
         print("[AI-Groq] No word-level timestamps, estimating from segments")
-        for segment in transcription.segments:
+        for segment in segments:
             seg_words = segment['text'].strip().split()
             if not seg_words:
                 continue
@@ -94,37 +217,148 @@ def transcribe_audio(audio_path: Path) -> tuple[str, list[dict]]:
     return formatted_transcript, word_timings
 
 
-def select_best_clips(transcript: str, video_title: str, video_path: Path = None) -> list[dict]:
-    """Pick the most engaging clips using either Groq (Llama 3) or Gemini (Flash)."""
-    provider = _get_provider()
-    print(f"[AI-{provider.title()}] Analyzing transcript for best clips...")
+async def transcribe_audio_async(audio: Path | bytes, filename: str = "audio.mp3",
+                                 chunk_s: float = TRANSCRIBE_CHUNK_SECONDS,
+                                 overlap_s: float = TRANSCRIBE_CHUNK_OVERLAP) -> tuple[str, list[dict]]:
+    """Use Groq's Whisper-large-v3 to get a timestamped transcript + word timings.
+
+    `audio` is an mp3 path or the mp3 bytes themselves (see extract_audio(pipe=True)).
+    Long audio is split into chunks transcribed concurrently. Chunk k owns
+    [k * chunk_s, (k + 1) * chunk_s): segments and words starting in another
+    chunk's window are dropped, so the overlap never shows up twice.
+    """
+    if not GROQ_API_KEY:
+        raise RuntimeError("GROQ_API_KEY required for transcription (Whisper).")
 
-    # Truncate transcript to ~8K tokens (~20K chars) to stay under Groq's 12K TPM limit
-    # Gemini Flash has a huge context window, but we keep it consistent for now.
-    MAX_TRANSCRIPT_CHARS = 20000
-    if len(transcript) > MAX_TRANSCRIPT_CHARS:
-        print(f"[AI] Transcript too long ({len(transcript)} chars), truncating to {MAX_TRANSCRIPT_CHARS} chars")
-        transcript = transcript[:MAX_TRANSCRIPT_CHARS] + "\n... [TRANSCRIPT TRUNCATED]"
+    if isinstance(audio, Path):
+        filename = audio.name
+        async with aiofiles.open(audio, "rb") as f:  # Keep the event loop free during the disk read
+            audio = await f.read()
+
+    key = cache.audio_key(audio, WHISPER_MODEL)
+    if (hit := cache.get(key)) is not None:
+        print(f"[AI-Cache] Reusing cached transcript for: {filename}")
+        formatted_transcript, word_timings = orjson.loads(hit)
+        return formatted_transcript, word_timings
+
+    chunks = await asyncio.to_thread(split_audio, audio, chunk_s, overlap_s)
+    print(f"[AI-Groq] Transcribing audio with Whisper: {filename} ({len(chunks)} chunk(s))")
+
+    sem = asyncio.Semaphore(LLM_CONCURRENCY)
+    groq_async = _async_groq()
+
+    async def one(index: int, data: bytes):
+        async with sem:
+            return await _call_with_retry_async(
+                groq_async.audio.transcriptions.create,
+                file=(f"{Path(filename).stem}_{index}.mp3", data),
+                model=WHISPER_MODEL,
+                response_format="verbose_json",
+                timestamp_granularities=["word", "segment"],
+            )
 
-    prompt = f"""You are a viral video editor. Analyze this transcript from the video titled "{video_title}".
+    try:
+        results = await asyncio.gather(*[one(i, data) for i, (_, data) in enumerate(chunks)])
+    finally:
+        await groq_async.close()
+
+    segments, words = [], []
+    have_words = True
+    for i, ((offset, _), transcription) in enumerate(zip(chunks, results)):
+        window_end = offset + chunk_s if i < len(chunks) - 1 else float("inf")
+
+        def owned(item: dict) -> bool:
+            return offset <= item["start"] + offset < window_end
+
+        for seg in transcription.segments:
+            if owned(seg):
+                segments.append({**seg, "start": seg["start"] + offset, "end": seg["end"] + offset})
+        chunk_words = getattr(transcription, "words", None)
+        if not chunk_words:
+            have_words = False
+            continue
+        for w in chunk_words:
+            if owned(w):
+                words.append({**w, "start": w.get("start", 0.0) + offset, "end": w.get("end", 0.0) + offset})
+
+    formatted_transcript, word_timings = _format_transcription(segments, words if have_words else None)
+    cache.set(key, orjson.dumps([formatted_transcript, word_timings]).decode())
+    return formatted_transcript, word_timings
 
-TRANSCRIPT:
-{transcript}
 
-Find the {NUM_CLIPS} most engaging, viral-worthy segments. 
+def transcribe_audio_chunked(audio: Path | bytes, filename: str = "audio.mp3") -> tuple[str, list[dict]]:
+    """Sync facade over transcribe_audio_async for non-async callers."""
+    return asyncio.run(transcribe_audio_async(audio, filename))
 
-CRITICAL REQUIREMENT: Each clip MUST be between {CLIP_MIN_SECONDS} and {CLIP_MAX_SECONDS} seconds long. 
-- If a great moment is only 10 seconds, EXPAND the start and end times to capture the surrounding context until you have at least {CLIP_MIN_SECONDS} seconds.
-- Do NOT return clips shorter than {CLIP_MIN_SECONDS} seconds.
-- Clips must be strictly under 60 seconds.
 
-Look for moments that are:
-- Emotionally intense or surprising
-- Contains a complete thought or story beat
-- Would hook a viewer scrolling on social media
-- Has a strong opening line
+# ── Response Schemas ────────────────────────────────────────
+# Passed to Gemini as response_schema so the reply is always well-formed JSON of
+# this shape (no code fences, no parse-failure fallback round). Groq gets the
+# equivalent guarantee from response_format={"type": "json_object"}.
+class YouTubeMetadata(TypedDict):
+    title: str
+    description: str
+    tags: list[str]
+
+
+class Clip(TypedDict):
+    clip_number: int
+    start_time: str
+    end_time: str
+    title: str
+    reason: str
+    hook: str
+
+
+class ClipWithMetadata(Clip):
+    youtube: YouTubeMetadata
 
-Return ONLY valid JSON (no markdown, no code blocks), an array of objects:
+
+class NumberedMetadata(YouTubeMetadata):
+    clip_number: int
+
+
+class MetadataBatch(TypedDict):
+    clips: list[NumberedMetadata]
+
+
+def _json_config(schema) -> dict:
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+# Trailing commas before a closing bracket, the most common LLM JSON slip
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+def _parse_json(text: str):
+    """Parse a JSON-mode reply as-is; only if that fails, repair it once and retry.
+
+    The repair keeps the first `[`/`{` through the last `]`/`}` (dropping markdown
+    fences or prose around the payload) and removes trailing commas. A clip array
+    cut off mid-object still yields the clips that arrived complete.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+        if not starts:
+            raise
+        start = min(starts)
+        end = max(text.rfind("]"), text.rfind("}")) + 1
+        try:
+            return orjson.loads(_TRAILING_COMMA.sub(r"\1", text[start:end]))
+        except orjson.JSONDecodeError:
+            if text[start] == "[" and (clips := list(_iter_clip_objects([text[start:]]))):
+                return clips
+            raise
+
+
+# ── Prompts ─────────────────────────────────────────────────
+# The invariant instructions live in the system block (Gemini system_instruction /
+# Groq system role) so providers can reuse the cached prefix across requests; only
+# the per-video title and transcript go in the user turn.
+# Shared by every clip-producing prompt; {metadata_field} adds the fused YouTube metadata
+_CLIP_OUTPUT_FORMAT = """Return ONLY valid JSON (no markdown, no code blocks), an array of objects:
 [
   {{
     "clip_number": 1,
@@ -132,141 +366,504 @@ Return ONLY valid JSON (no markdown, no code blocks), an array of objects:
     "end_time": "MM:SS",
     "title": "Short catchy title for this clip",
     "reason": "Why this segment is engaging",
-    "hook": "The opening line that grabs attention"
+    "hook": "The opening line that grabs attention"{metadata_field}
   }}
 ]"""
-    
-    response_text = ""
-    try:
-        if provider == "gemini":
-            try:
-                model = genai.GenerativeModel(GEMINI_MODEL)
-                # Gemini typically wraps JSON in markdown blocks, we ask it not to, but handle it anyway
-                result = model.generate_content(
-                    f"You are a viral video editor. Return only JSON.\n\n{prompt}",
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                response_text = result.text
-            except Exception as gem_err:
-                print(f"[AI-Gemini] API failed: {gem_err}. Falling back to Groq...")
-                provider = "groq" # Switch provider for the fallback call
-
-        if provider == "groq":
-            # Groq
-            response = groq_client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a viral video editor. Return only JSON."}, 
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
-            response_text = response.choices[0].message.content
-
-        # Clean potential markdown code blocks if the provider/model ignores instructions
-        response_text = response_text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(response_text)
-    
-    except Exception as e:
-        print(f"[AI-{provider.title()}] Error parsing JSON or API call: {e}")
-        data = []
-    
-    # Extract list from various possible JSON structures
-    clips_list = []
-    if isinstance(data, list):
-        clips_list = data
-    elif isinstance(data, dict):
-        if "clips" in data:
-            clips_list = data["clips"]
-        elif "segments" in data:
-            clips_list = data["segments"]
-        elif all(k.isdigit() or k.startswith("clip") for k in data.keys()):
-            clips_list = list(data.values())
+
+# Extra per-clip field when metadata is generated in the same request as the clips
+_METADATA_FIELD = """,
+    "youtube": {
+      "title": "A catchy, clickbait-style YouTube Shorts title under 70 characters",
+      "description": "A YouTube description (3-5 lines) with hashtags",
+      "tags": ["tag1", "tag2", "tag3"]
+    }"""
+
+_CLIP_SELECTION_SYSTEM_TMPL = f"""You are a viral video editor. You will be given a transcript of a video.
+
+Find the {{num_clips}} most engaging, viral-worthy segments.
+
+CRITICAL REQUIREMENT: Each clip MUST be between {CLIP_MIN_SECONDS} and {CLIP_MAX_SECONDS} seconds long.
+- If a great moment is only 10 seconds, EXPAND the start and end times to capture the surrounding context until you have at least {CLIP_MIN_SECONDS} seconds.
+- Do NOT return clips shorter than {CLIP_MIN_SECONDS} seconds.
+- Clips must be strictly under 60 seconds.
+
+Look for moments that are:
+- Emotionally intense or surprising
+- Contains a complete thought or story beat
+- Would hook a viewer scrolling on social media
+- Has a strong opening line
+
+""" + _CLIP_OUTPUT_FORMAT
+
+_CLIP_SELECTION_SYSTEM = _CLIP_SELECTION_SYSTEM_TMPL.format(num_clips=NUM_CLIPS, metadata_field="")
+_CLIP_ARTIFACTS_SYSTEM = _CLIP_SELECTION_SYSTEM_TMPL.format(num_clips=NUM_CLIPS, metadata_field=_METADATA_FIELD)
+# Map step of select_best_clips_mapreduce: a shortlist per transcript window
+_CLIP_CANDIDATES_SYSTEM = _CLIP_SELECTION_SYSTEM_TMPL.format(num_clips=MAPREDUCE_CANDIDATES, metadata_field="")
+
+_CLIP_REDUCE_SYSTEM_TMPL = """You are a viral video editor. You will be given candidate clips, as JSON, found in different parts of one video's transcript.
+
+Pick the {num_clips} most engaging, viral-worthy candidates. Keep each chosen clip's start_time, end_time, title, reason and hook exactly as given, and renumber clip_number from 1.
+
+""" + _CLIP_OUTPUT_FORMAT
+
+_CLIP_REDUCE_SYSTEM = _CLIP_REDUCE_SYSTEM_TMPL.format(num_clips=NUM_CLIPS, metadata_field="")
+_CLIP_REDUCE_ARTIFACTS_SYSTEM = _CLIP_REDUCE_SYSTEM_TMPL.format(num_clips=NUM_CLIPS, metadata_field=_METADATA_FIELD)
+
+_CLIP_REDUCE_USER_TMPL = """Candidate clips from the video titled "{video_title}":
+
+{candidates}"""
+
+_CLIP_SELECTION_USER_TMPL = """Analyze this transcript from the video titled "{video_title}".
+
+TRANSCRIPT:
+{transcript}"""
+
+# Several clips marshalled into one request (generate_all_clip_assets)
+_METADATA_BATCH_SYSTEM = """You are a YouTube SEO expert specializing in Roblox gaming shorts.
+
+Generate YouTube metadata for EACH of the short clips you are given. Return ONLY valid JSON:
+{
+  "clips": [
+    {
+      "clip_number": 1,
+      "title": "A catchy, clickbait-style YouTube title under 70 characters.",
+      "description": "A YouTube description (3-5 lines) with hashtags.",
+      "tags": ["tag1", "tag2", "tag3"]
+    }
+  ]
+}"""
+
+_METADATA_BATCH_CLIP_TMPL = (
+    'CLIP {clip_number}\n'
+    'CLIP TITLE: "{clip_title}"\n'
+    'CLIP HOOK: "{clip_hook}"'
+)
+
+
+# Keep the transcript within TRANSCRIPT_TOKEN_BUDGET to stay under Groq's 12K TPM limit
+# Gemini Flash has a huge context window, but we keep it consistent for now.
+# Longer transcripts go through select_best_clips_mapreduce instead of being cut.
+# Word pieces, numbers and punctuation each count as a token: much closer to a BPE
+# count than chars / 4 for timestamp-heavy transcript lines, with no tokenizer download.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+def _truncate_to_budget(transcript: str, budget: int) -> str:
+    """Keep whole transcript lines until the token budget is spent."""
+    kept, used = [], 0
+    for line in transcript.splitlines(keepends=True):
+        used += _estimate_tokens(line)
+        if used > budget:
+            break
+        kept.append(line)
+    return "".join(kept)
+
+_TRANSCRIPT_LINE = re.compile(r"^\[(\d+:\d\d) - (\d+:\d\d)\] ?(.*)$")
+_FILLERS = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|h+m+|you know|i mean)\b[,.]?\s*", re.IGNORECASE)
+
+
+def _compress_transcript(transcript: str, min_words: int = 3) -> str:
+    """Shrink a formatted transcript without losing coverage or timestamps.
+
+    Strips filler words, drops segments left empty, and folds segments shorter than
+    `min_words` into the previous one (extending its end time), so fewer tokens
+    carry the same content. Idempotent.
+    """
+    lines = []  # [start, end, text]
+    for raw in transcript.splitlines():
+        m = _TRANSCRIPT_LINE.match(raw)
+        if not m:
+            if raw.strip():
+                lines.append([None, None, raw])
+            continue
+        text = " ".join(_FILLERS.sub("", m.group(3)).split())
+        if not text:
+            continue
+        if lines and lines[-1][0] is not None and len(text.split()) < min_words:
+            lines[-1][1] = m.group(2)
+            lines[-1][2] += " " + text
         else:
-            # If it's a single clip object
-            if "start_time" in data and "end_time" in data:
-                clips_list = [data]
-            else:
-                clips_list = []
-
-    # Final Fallback: If AI fails to find clips, pick a segment from the middle
-    if not clips_list:
-        print(f"[AI] [WARN] AI returned no valid clips, using robust fallback.")
-        clips_list = [{
-            "clip_number": 1,
-            "start_time": "00:15",
-            "end_time": "01:05",
-            "title": video_title[:50],
-            "reason": "AI fallback selection",
-            "hook": "You need to see this!"
-        }]
-            
-    return clips_list[:NUM_CLIPS]
-
-
-def generate_youtube_metadata(clip_title: str, clip_hook: str, video_title: str) -> dict:
-    """Generate SEO-optimized YouTube title, description, and tags using Llama 3 or Gemini."""
+            lines.append([m.group(1), m.group(2), text])
+
+    compressed = "".join(
+        f"[{start} - {end}] {text}\n" if start is not None else f"{text}\n"
+        for start, end, text in lines
+    )
+    if len(compressed) < len(transcript):
+        print(f"[AI] Compressed transcript {len(transcript)} -> {len(compressed)} chars")
+    return compressed
+
+
+def _clips_prompt(transcript: str, video_title: str) -> str:
+    transcript = _compress_transcript(transcript)
+    tokens = _estimate_tokens(transcript)
+    if tokens > TRANSCRIPT_TOKEN_BUDGET:
+        print(f"[AI] Transcript too long (~{tokens} tokens), truncating to {TRANSCRIPT_TOKEN_BUDGET} tokens")
+        transcript = _truncate_to_budget(transcript, TRANSCRIPT_TOKEN_BUDGET) + "... [TRANSCRIPT TRUNCATED]"
+
+    return _CLIP_SELECTION_USER_TMPL.format(video_title=video_title, transcript=transcript)
+
+
+def _fallback_clip(video_title: str) -> dict:
+    return {
+        "clip_number": 1,
+        "start_time": "00:15",
+        "end_time": "01:05",
+        "title": video_title[:50],
+        "reason": "AI fallback selection",
+        "hook": "You need to see this!"
+    }
+
+
+def _idempotency_headers() -> dict:
+    """A fresh key per logical request, reused by each of its retries.
+
+    Built once outside _call_with_retry, so a retried completion isn't billed twice
+    while a separate run with the same prompt still gets its own completion.
+    """
+    return {"Idempotency-Key": uuid.uuid4().hex}
+
+
+def _no_provider() -> RuntimeError:
+    return RuntimeError("No AI provider configured (set GROQ_API_KEY or GEMINI_API_KEY)")
+
+
+def _iter_clip_objects(chunks):
+    """Yield each clip dict from a streamed JSON response as soon as its closing brace arrives.
+
+    Tracks brace depth outside of string literals, so it copes with a bare array,
+    a {"clips": [...]} wrapper, or stray markdown fences around either.
+    """
+    text = ""
+    opens = []          # offsets of currently open '{' in text
+    in_string = escaped = False
+    for chunk in chunks:
+        pos = len(text)
+        text += chunk
+        for i in range(pos, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                opens.append(i)
+            elif ch == "}" and opens:
+                start = opens.pop()
+                try:
+                    obj = orjson.loads(text[start:i + 1])
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and "start_time" in obj and "end_time" in obj:
+                    yield obj
+
+
+def _stream_cached(key: str | None, stream):
+    """Pass streamed text chunks through, storing the full response once the stream completes."""
+    if key and (hit := cache.get(key)) is not None:
+        print("[AI-Cache] Reusing cached response")
+        yield hit
+        return
+    parts = []
+    for chunk in stream():
+        if chunk:
+            parts.append(chunk)
+            yield chunk
+    if key:
+        cache.set(key, "".join(parts))
+
+
+def iter_best_clips(transcript: str, video_title: str, force_cache: bool = AI_CACHE_CLIPS,
+                    with_metadata: bool = False):
+    """Pick the most engaging clips, yielding each clip dict while the model is still writing the rest.
+
+    Lets the caller start cutting clip 1 before the response for clip N has arrived.
+    With `with_metadata`, each clip also carries a "youtube" dict (title/description/tags).
+    """
     provider = _get_provider()
-    print(f"[AI-{provider.title()}] Generating YouTube metadata for: {clip_title}")
+    print(f"[AI-{provider.title()}] Streaming best clips from transcript...")
+    prompt = _clips_prompt(transcript, video_title)
+    system = _CLIP_ARTIFACTS_SYSTEM if with_metadata else _CLIP_SELECTION_SYSTEM
+    schema = list[ClipWithMetadata] if with_metadata else list[Clip]
+    yielded = 0
+
+    for provider in _router.order():
+        started = time.monotonic()
+        try:
+            if provider == "gemini":
+                model = _gemini_model(system)
+                stream = _stream_cached(
+                    _completion_key(GEMINI_MODEL, system, prompt, None, force_cache),
+                    lambda: (c.text for c in _call_with_retry(
+                        model.generate_content,
+                        prompt,
+                        generation_config=_json_config(schema),
+                        stream=True,
+                    )),
+                )
+            else:
+                # Groq's JSON mode can't be combined with streaming; the prompt already asks for bare JSON
+                stream = _stream_cached(
+                    _completion_key(GROQ_MODEL, system, prompt, 0.7, force_cache),
+                    lambda: (c.choices[0].delta.content for c in _call_with_retry(
+                        _groq().chat.completions.create,
+                        model=GROQ_MODEL,
+                        messages=[
+                            {"role": "system", "content": system},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.7,
+                        stream=True,
+                        extra_headers=_idempotency_headers(),
+                    )),
+                )
+            clips = _iter_clip_objects(stream)
+            try:
+                for clip in clips:
+                    yield clip
+                    yielded += 1
+                    if yielded == NUM_CLIPS:
+                        # Stop yielding, not reading: the tail of the response must still be consumed
+                        for _ in clips:
+                            pass
+            finally:
+                clips.close()
+                stream.close()
+        except Exception as e:
+            _router.record(provider, False, time.monotonic() - started)
+            print(f"[AI-{provider.title()}] Error streaming clips: {e}")
+            # Clips already handed out can't be taken back, so only fail over before the first
+            if yielded:
+                return
+            continue
+        _router.record(provider, True, time.monotonic() - started)
+        break
+
+    if not yielded:
+        print("[AI] [WARN] AI returned no valid clips, using robust fallback.")
+        yield _fallback_clip(video_title)
+
+
+def generate_all_clip_artifacts(transcript: str, video_title: str, force_cache: bool = AI_CACHE_CLIPS):
+    """Clips and their YouTube metadata from one streamed request instead of 1 + N calls.
+
+    Yields clip dicts with a "youtube" key; callers should fall back to
+    generate_all_clip_assets for any clip where it is missing or malformed.
+    """
+    transcript = _compress_transcript(transcript)
+    if _estimate_tokens(transcript) > TRANSCRIPT_TOKEN_BUDGET:
+        yield from asyncio.run(select_best_clips_mapreduce(transcript, video_title, with_metadata=True,
+                                                           force_cache=force_cache))
+        return
+    yield from iter_best_clips(transcript, video_title, force_cache, with_metadata=True)
 
-    prompt = f"""You are a YouTube SEO expert specializing in Roblox gaming shorts.
 
-ORIGINAL VIDEO: "{video_title}"
-CLIP TITLE: "{clip_title}"
-CLIP HOOK: "{clip_hook}"
+async def _complete_async(system: str, prompt: str, temperature: float, schema,
+                          groq_async: "AsyncGroq | None", label: str, force_cache: bool = False,
+                          lite: bool = False) -> str:
+    """One JSON completion from the healthiest provider, failing over to the next on error.
 
-Generate YouTube metadata for this short clip. Return ONLY valid JSON:
-{{
-  "title": "A catchy, clickbait-style YouTube title under 70 characters.",
-  "description": "A YouTube description (3-5 lines) with hashtags.",
-  "tags": ["tag1", "tag2", "tag3"]
-}}"""
+    Goes through the response cache; Gemini keys ignore temperature as its calls don't set one.
+    `lite` routes short, formulaic generations to the small model tier.
+    """
+    groq_model = GROQ_MODEL_LITE if lite else GROQ_MODEL
+    gemini_model = GEMINI_MODEL_LITE if lite else GEMINI_MODEL
+    last_err = None
+    for provider in _router.order():
+        if provider == "gemini":
+            key = _completion_key(gemini_model, system, prompt, None, force_cache)
+        else:
+            key = _completion_key(groq_model, system, prompt, temperature, force_cache)
+        if key and (hit := cache.get(key)) is not None:
+            print(f"[AI-Cache] Reusing cached response ({label})")
+            return hit
+        started = time.monotonic()
+        try:
+            if provider == "gemini":
+                text = (await _call_with_retry_async(
+                    _gemini_model(system, gemini_model).generate_content_async,
+                    prompt,
+                    generation_config=_json_config(schema)
+                )).text
+            else:
+                text = (await _call_with_retry_async(
+                    groq_async.chat.completions.create,
+                    model=groq_model,
+                    messages=[
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=temperature,
+                    response_format={"type": "json_object"},
+                    extra_headers=_idempotency_headers()
+                )).choices[0].message.content
+        except Exception as e:
+            _router.record(provider, False, time.monotonic() - started)
+            print(f"[AI-{provider.title()}] {label} failed: {e}")
+            last_err = e
+            continue
+        _router.record(provider, True, time.monotonic() - started)
+        if key:
+            cache.set(key, text)
+        return text
+    raise last_err or _no_provider()
+
+
+def _transcript_windows(transcript: str, window_chars: int, overlap_lines: int = 2) -> list[str]:
+    """Split a formatted transcript on segment (line) boundaries into ~window_chars windows.
+
+    Consecutive windows share `overlap_lines` segments so a moment on a boundary is
+    seen whole by at least one of them.
+    """
+    lines = transcript.splitlines(keepends=True)
+    windows, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) > window_chars:
+            windows.append("".join(current))
+            current = current[-overlap_lines:] if overlap_lines else []
+            size = sum(map(len, current))
+        current.append(line)
+        size += len(line)
+    if current:
+        windows.append("".join(current))
+    return windows
+
+
+async def select_best_clips_mapreduce(transcript: str, video_title: str, with_metadata: bool = False,
+                                      force_cache: bool = AI_CACHE_CLIPS) -> list[dict]:
+    """Clip selection over the whole transcript, however long, instead of truncating it.
+
+    Map: each ~MAPREDUCE_WINDOW_CHARS window is shortlisted to MAPREDUCE_CANDIDATES
+    clips concurrently. Reduce: one final call picks the best NUM_CLIPS of them.
+    """
+    windows = _transcript_windows(_compress_transcript(transcript), MAPREDUCE_WINDOW_CHARS)
+    print(f"[AI] Transcript is {len(transcript)} chars, ranking {len(windows)} windows in parallel")
+    sem = asyncio.Semaphore(LLM_CONCURRENCY)
+    groq_async = _async_groq() if GROQ_API_KEY else None
+
+    async def rank(window: str) -> list[dict]:
+        prompt = _CLIP_SELECTION_USER_TMPL.format(video_title=video_title, transcript=window)
+        async with sem:
+            text = await _complete_async(_CLIP_CANDIDATES_SYSTEM, prompt, 0.7, list[Clip], groq_async, "Window ranking",
+                                         force_cache=force_cache)
+        return list(_iter_clip_objects([text]))
 
-    response_text = ""
     try:
-        if provider == "gemini":
+        ranked = await asyncio.gather(*[rank(w) for w in windows], return_exceptions=True)
+        candidates = [c for r in ranked if not isinstance(r, Exception) for c in r]
+        print(f"[AI] Map step found {len(candidates)} candidate clips")
+
+        clips = candidates
+        if len(candidates) > NUM_CLIPS:
+            system = _CLIP_REDUCE_ARTIFACTS_SYSTEM if with_metadata else _CLIP_REDUCE_SYSTEM
+            schema = list[ClipWithMetadata] if with_metadata else list[Clip]
+            prompt = _CLIP_REDUCE_USER_TMPL.format(
+                video_title=video_title, candidates=orjson.dumps(candidates).decode()
+            )
             try:
-                model = genai.GenerativeModel(GEMINI_MODEL)
-                result = model.generate_content(
-                    f"You are a YouTube SEO expert. Return only JSON.\n\n{prompt}",
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                response_text = result.text
-            except Exception as gem_err:
-                print(f"[AI-Gemini] Metadata failed: {gem_err}. Falling back to Groq...")
-                provider = "groq"
-
-        if provider == "groq":
-            response = groq_client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a YouTube SEO expert. Return only JSON."}, 
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                response_format={"type": "json_object"}
+                text = await _complete_async(system, prompt, 0.7, schema, groq_async, "Clip reduce",
+                                             force_cache=force_cache)
+                clips = list(_iter_clip_objects([text])) or candidates
+            except Exception as e:
+                print(f"[AI] Reduce step failed, keeping the first candidates: {e}")
+    finally:
+        if groq_async:
+            await groq_async.close()
+
+    if not clips:
+        print("[AI] [WARN] AI returned no valid clips, using robust fallback.")
+        return [_fallback_clip(video_title)]
+    return clips[:NUM_CLIPS]
+
+
+def _metadata_fallback(clip_title: str, video_title: str) -> dict:
+    return {
+        "title": clip_title[:70],
+        "description": f"#shorts #roblox #gaming\n\nOriginal video: {video_title}",
+        "tags": ["roblox", "gaming", "shorts", "clips"]
+    }
+
+
+async def generate_all_clip_assets_async(clips: list[dict], video_title: str) -> list[dict]:
+    """Metadata for many clips with one request per METADATA_BATCH_SIZE clips instead of one per clip.
+
+    Clips are numbered blocks in a single prompt and the reply is matched back by
+    clip_number; any clip the model skipped gets the usual fallback.
+    """
+    batches = [clips[i:i + METADATA_BATCH_SIZE] for i in range(0, len(clips), METADATA_BATCH_SIZE)]
+    print(f"[AI] Generating metadata for {len(clips)} clips in {len(batches)} request(s)")
+    groq_async = _async_groq() if GROQ_API_KEY else None
+
+    async def one(batch: list[dict]) -> dict:
+        prompt = f'ORIGINAL VIDEO: "{video_title}"\n\n' + "\n\n".join(
+            _METADATA_BATCH_CLIP_TMPL.format(
+                clip_number=n,
+                clip_title=clip.get("title", f"Clip {n}"),
+                clip_hook=clip.get("hook", ""),
             )
-            response_text = response.choices[0].message.content
-        
-        # Cleanup
-        response_text = response_text.replace("```json", "").replace("```", "").strip()
-        return json.loads(response_text)
+            for n, clip in enumerate(batch, 1)
+        )
+        text = await _complete_async(_METADATA_BATCH_SYSTEM, prompt, 0.8, MetadataBatch, groq_async,
+                                     "Batch metadata", force_cache=AI_CACHE_METADATA, lite=True)
+        data = _parse_json(text)
+        entries = data.get("clips", []) if isinstance(data, dict) else data
+        return {e.get("clip_number"): e for e in entries if isinstance(e, dict)}
+
+    try:
+        results = await asyncio.gather(*[one(b) for b in batches], return_exceptions=True)
+    finally:
+        if groq_async:
+            await groq_async.close()
+
+    metadata = []
+    for batch, by_number in zip(batches, results):
+        if isinstance(by_number, Exception):
+            print(f"[AI] Batch metadata failed: {by_number}")
+            by_number = {}
+        for n, clip in enumerate(batch, 1):
+            entry = by_number.get(n)
+            if entry and entry.get("title"):
+                metadata.append({"title": entry["title"], "description": entry.get("description", ""),
+                                 "tags": entry.get("tags", [])})
+            else:
+                metadata.append(_metadata_fallback(clip.get("title", ""), video_title))
+    return metadata
+
+
+def generate_all_clip_assets(clips: list[dict], video_title: str) -> list[dict]:
+    """Sync facade over generate_all_clip_assets_async for non-async callers."""
+    return asyncio.run(generate_all_clip_assets_async(clips, video_title))
+
 
-    except Exception as e:
-        print(f"[AI-{provider.title()}] Metadata generation failed: {e}")
-        return {
-            "title": clip_title[:70],
-            "description": f"#shorts #roblox #gaming\n\nOriginal video: {video_title}",
-            "tags": ["roblox", "gaming", "shorts", "clips"]
-        }
+# Unpadded / odd-width "M:SS" or "H:MM:SS" the fast path below doesn't take
+_TS_RE = re.compile(r"^\s*(\d+):(\d+)(?::(\d+))?\s*$")
 
 
+@lru_cache(maxsize=4096)
 def timestamp_to_seconds(ts: str) -> float:
-    """Convert MM:SS or HH:MM:SS to seconds."""
-    parts = ts.strip().split(":")
-    if len(parts) == 2:
-        return int(parts[0]) * 60 + int(parts[1])
-    elif len(parts) == 3:
-        return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-    return 0.0
+    """Convert MM:SS or HH:MM:SS to seconds; raises ValueError on anything else."""
+    b = ts.strip().encode()
+    n = len(b)
+    # Fast path for zero-padded "MM:SS" / "HH:MM:SS": byte arithmetic, no split() or int()
+    if n == 5 and b[2] == 58 and b[:2].isdigit() and b[3:].isdigit():
+        return float((b[0] - 48) * 600 + (b[1] - 48) * 60 + (b[3] - 48) * 10 + (b[4] - 48))
+    if n == 8 and b[2] == 58 and b[5] == 58 and b[:2].isdigit() and b[3:5].isdigit() and b[6:].isdigit():
+        return float((b[0] - 48) * 36000 + (b[1] - 48) * 3600 + (b[3] - 48) * 600
+                     + (b[4] - 48) * 60 + (b[6] - 48) * 10 + (b[7] - 48))
+
+    m = _TS_RE.match(ts)
+    if not m:
+        raise ValueError(f"Unparseable timestamp: {ts!r}")
+    first, second, third = m.groups()
+    if third is None:
+        return float(int(first) * 60 + int(second))
+    return float(int(first) * 3600 + int(second) * 60 + int(third))
@@ -11,40 +11,166 @@ Usage:
 
 import argparse
 import gc
-import shutil
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
 from pathlib import Path
 
-from config import DOWNLOADS_DIR, CLIPS_DIR, OUTPUT_DIR, NUM_CLIPS
+import orjson
+
+from config import DOWNLOADS_DIR, OUTPUT_DIR, NUM_CLIPS, WHISPER_MODEL, CLIP_WORKERS, SAVE_TRANSCRIPT
 from downloader import check_new_videos, download_video, extract_audio, mark_processed, download_random_music
-from gemini_ai import transcribe_audio, select_best_clips, generate_youtube_metadata, timestamp_to_seconds
-from video_processor import cut_clip, mix_audio, add_subtitles, cleanup_temp_files
+from gemini_ai import transcribe_audio_chunked, generate_all_clip_artifacts, generate_all_clip_assets, timestamp_to_seconds
+from video_processor import render_final_clip, write_clip_subtitles, cleanup_temp_files, store_content_addressed
+
+
+class Step(IntEnum):
+    """Pipeline stages reported to progress callbacks."""
+    STARTING = 0
+    DOWNLOADING = 1
+    DOWNLOADED = 2
+    MUSIC = 3
+    AUDIO = 4
+    TRANSCRIBED = 5
+    CLIPS_SELECTED = 6
+    CLIP_CUT = 7
+    CLIP_SUBTITLED = 8
+    CLIP_METADATA = 9
+    DONE = 10
+
+
+STEP_LABELS = {
+    Step.STARTING: "Starting...",
+    Step.DOWNLOADING: "Downloading video...",
+    Step.DOWNLOADED: "Video downloaded",
+    Step.MUSIC: "Background music ready",
+    Step.AUDIO: "Audio extracted",
+    Step.TRANSCRIBED: "Transcribed",
+    Step.CLIPS_SELECTED: "Clips selected",
+    Step.CLIP_CUT: "Cut video",
+    Step.CLIP_SUBTITLED: "Subtitles burned",
+    Step.CLIP_METADATA: "Generated metadata",
+    Step.DONE: "Done!",
+}
+
+
+def step_label(step: int, clip_num: int = 0) -> str:
+    """Human-readable text for a Step code."""
+    label = STEP_LABELS[Step(step)]
+    return f"Clip {clip_num}: {label}" if clip_num else label
+
+
+def index_word_timings(word_timings: list[dict]) -> tuple[array, array]:
+    """Start/end times as two packed float arrays (SoA), built once per video.
+
+    Whisper emits words in time order, so these can be bisected; packed doubles
+    take a fraction of the memory of per-word float objects.
+    """
+    return (array("d", (w["start"] for w in word_timings)),
+            array("d", (w["end"] for w in word_timings)))
 
 
-def extract_clip_words(all_word_timings: list[dict], start_sec: float, end_sec: float) -> list[dict]:
+def extract_clip_words(all_word_timings: list[dict], start_sec: float, end_sec: float,
+                       index: tuple[array, array] | None = None) -> list[dict]:
     """Extract word timings that fall within a clip's time range.
 
     Adjusts timestamps to be relative to the clip start (so they start at 0).
-    Returns timings in the format expected by create_word_srt: start_ms/end_ms.
+    Returns timings in the format expected by create_clip_ass: start_ms/end_ms.
+
+    The window is found by bisecting the start times from index_word_timings
+    instead of scanning the whole transcript for every clip.
     """
+    starts, ends = index or index_word_timings(all_word_timings)
+    lo = bisect_left(starts, start_sec)
+    hi = bisect_right(starts, end_sec + 0.5, lo)
+
     clip_words = []
-    for w in all_word_timings:
-        w_start = w["start"]
-        w_end = w["end"]
-        if w_start >= start_sec and w_end <= end_sec + 0.5:
+    for i in range(lo, hi):
+        w_end = ends[i]
+        if w_end <= end_sec + 0.5:
             clip_words.append({
-                "word": w["word"],
-                "start_ms": int((w_start - start_sec) * 1000),
+                "word": all_word_timings[i]["word"],
+                "start_ms": int((starts[i] - start_sec) * 1000),
                 "end_ms": int((w_end - start_sec) * 1000),
             })
     return clip_words
 
 
+def _transcript_digest(video_path: Path) -> list:
+    """Identity of a transcript: video id, file size (a re-download gets a new mtime) and model."""
+    return [video_path.stem, video_path.stat().st_size, WHISPER_MODEL]
+
+
+def load_cached_transcript(video_path: Path):
+    """(transcript, word_timings) saved by an earlier run on the same video, else None."""
+    cache_path = DOWNLOADS_DIR / f"{video_path.stem}_transcript.json"
+    try:
+        data = orjson.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if data.get("digest") != _transcript_digest(video_path):
+        return None
+    return data["transcript"], data["words"]
+
+
+def save_transcript(video_path: Path, transcript: str, word_timings: list):
+    cache_path = DOWNLOADS_DIR / f"{video_path.stem}_transcript.json"
+    cache_path.write_bytes(
+        orjson.dumps({"digest": _transcript_digest(video_path), "transcript": transcript, "words": word_timings})
+    )
+
+
+def _has_metadata(clip_data: dict) -> bool:
+    yt_meta = clip_data.get("youtube")
+    return isinstance(yt_meta, dict) and bool(yt_meta.get("title"))
+
+
+def render_clip(video_path: Path, music_path: Path | None, clip_data: dict, word_timings: list[dict],
+                word_index: tuple[array, array], step_progress) -> Path:
+    """Cut, mix and subtitle one selected clip; returns its final path in OUTPUT_DIR."""
+    clip_num = clip_data["clip_number"]
+    start = timestamp_to_seconds(clip_data["start_time"])
+    end = timestamp_to_seconds(clip_data["end_time"])
+
+    # Extract word timings from Whisper that fall in this clip's range
+    clip_word_timings = extract_clip_words(word_timings, start, end, word_index)
+    print(f"  -> Found {len(clip_word_timings)} words in clip range")
+
+    # Get the raw transcript text for this clip (fallback for subtitles)
+    clip_text_parts = [w["word"] for w in clip_word_timings]
+    clip_text = " ".join(clip_text_parts) if clip_text_parts else clip_data.get("hook", "")
+
+    # Cut + 9:16 crop + music mix + subtitles in a single ffmpeg pass
+    step_progress(Step.CLIP_CUT, f"Clip {clip_num}: Rendering ({end - start:.1f}s)", clip_num)
+    subs_path = None
+    try:
+        subs_path = write_clip_subtitles(clip_text, clip_num, clip_word_timings)
+        final_path = render_final_clip(video_path, start, end, music_path, subs_path, clip_num)
+    except Exception as e:
+        if not subs_path:
+            raise
+        print(f"  -> Subtitle burn failed: {e}, rendering without subtitles")
+        final_path = render_final_clip(video_path, start, end, music_path, None, clip_num)
+
+    final_path = store_content_addressed(final_path)
+    step_progress(Step.CLIP_SUBTITLED, f"Clip {clip_num}: Subtitles burned", clip_num)
+
+    print(f"  -> Clip {clip_num} done: {final_path.name}")
+    return final_path
+
+
 def process_video(video_url: str, video_title: str = "Unknown", progress_callback=None):
-    """Run the full pipeline on a single video."""
-    def update_progress(percent: int, step: str):
-        print(f"[{percent}%] {step}")
+    """Run the full pipeline on a single video.
+
+    progress_callback(percent, step, clip_num) receives a Step code rather than the
+    printed detail line, so it can be published as plain integers.
+    """
+    def update_progress(percent: int, step: Step, detail: str, clip_num: int = 0):
+        print(f"[{percent}%] {detail}")
         if progress_callback:
-            progress_callback(percent, step)
+            progress_callback(percent, step, clip_num)
 
     print(f"\n{'='*60}")
     print(f"Processing: {video_title}")
@@ -55,103 +181,102 @@ def process_video(video_url: str, video_title: str = "Unknown", progress_callbac
     total_steps = 5 + (NUM_CLIPS * 3)
     current_step = 0
 
-    def step_progress(step_name: str):
+    progress_lock = threading.Lock()
+
+    def step_progress(step: Step, detail: str, clip_num: int = 0):
         nonlocal current_step
-        current_step += 1
-        percent = int((current_step / total_steps) * 100)
-        update_progress(percent, step_name)
+        # Clip workers report concurrently
+        with progress_lock:
+            current_step += 1
+            percent = int((current_step / total_steps) * 100)
+            update_progress(percent, step, detail, clip_num)
 
     # Step 1: Download video
-    update_progress(0, "Downloading video...")
+    update_progress(0, Step.DOWNLOADING, "Downloading video...")
     video_path = download_video(video_url)
-    step_progress(f"Downloaded: {video_path.name}")
+    step_progress(Step.DOWNLOADED, f"Downloaded: {video_path.name}")
 
     # Step 2: Download background music
     music_path = None
     try:
         music_path = download_random_music()
-        step_progress(f"Music: {music_path.name}")
+        step_progress(Step.MUSIC, f"Music: {music_path.name}")
     except Exception as e:
-        step_progress(f"Music skipped: {e}")
-
-    # Step 3: Extract audio for transcription
-    audio_path = extract_audio(video_path)
-    step_progress(f"Audio extracted: {audio_path.name}")
-
-    # Step 4: Transcribe with Groq (get text + word-level timestamps)
-    try:
-        transcript, word_timings = transcribe_audio(audio_path)
-        step_progress(f"Transcribed: {len(transcript)} chars, {len(word_timings)} words")
-    finally:
-        gc.collect()
+        step_progress(Step.MUSIC, f"Music skipped: {e}")
+
+    cached = load_cached_transcript(video_path) if SAVE_TRANSCRIPT else None
+    if cached:
+        # Re-run on a video we've already transcribed: skip audio extraction and Whisper
+        transcript, word_timings = cached
+        step_progress(Step.AUDIO, "Audio extraction skipped: transcript cached")
+        step_progress(Step.TRANSCRIBED, f"Transcript reused: {len(transcript)} chars, {len(word_timings)} words")
+    else:
+        # Step 3: Extract audio for transcription (kept in memory, never written to disk)
+        audio = extract_audio(video_path, pipe=True)
+        step_progress(Step.AUDIO, f"Audio extracted: {len(audio) / (1024 * 1024):.2f} MB")
 
-    # Save transcript for reference
-    transcript_path = DOWNLOADS_DIR / f"{video_path.stem}_transcript.txt"
-    transcript_path.write_text(transcript, encoding="utf-8")
+        # Step 4: Transcribe with Groq (get text + word-level timestamps)
+        try:
+            transcript, word_timings = transcribe_audio_chunked(audio, filename=f"{video_path.stem}.mp3")
+            step_progress(Step.TRANSCRIBED, f"Transcribed: {len(transcript)} chars, {len(word_timings)} words")
+        finally:
+            # Refcounting frees the audio bytes here; no collector pass needed
+            del audio
 
-    # Step 5: Select best clips (AI-powered smart clipping)
-    clips = select_best_clips(transcript, video_title, video_path=video_path)
-    step_progress(f"Found {len(clips)} clips")
+        # Saved for reference, and so a retry of this video skips transcription
+        if SAVE_TRANSCRIPT:
+            save_transcript(video_path, transcript, word_timings)
 
-    for c in clips:
-        print(f"   Clip {c['clip_number']}: {c['start_time']} -> {c['end_time']} | {c['title']}")
+    word_index = index_word_timings(word_timings)
 
-    # Process each clip
-    final_outputs = []
+    # Step 5: Select best clips + their YouTube metadata in one request, streamed
+    # so clip 1 is cut while the model is still writing the later ones
     clips_metadata = []
-
-    for clip_data in clips:
+    selected = []
+
+    # Each clip renders in its own worker as soon as it streams in; ffmpeg runs
+    # outside the GIL, so clips cut/mix/burn side by side instead of one after another
+    with ThreadPoolExecutor(max_workers=max(1, min(NUM_CLIPS, CLIP_WORKERS)), thread_name_prefix="clip") as pool:
+        renders = []
+        for clip_data in generate_all_clip_artifacts(transcript, video_title):
+            try:
+                timestamp_to_seconds(clip_data["start_time"])
+                timestamp_to_seconds(clip_data["end_time"])
+            except (KeyError, AttributeError, ValueError) as e:
+                print(f"   Skipping clip without usable timestamps: {e!r}")
+                continue
+            if not selected:
+                step_progress(Step.CLIPS_SELECTED, "First clip selected")
+            # Numbered by arrival: map-reduce candidates can repeat numbers, and
+            # concurrent renders must not share sub_N.ass / final_clip_N.mp4 files
+            clip_data["clip_number"] = len(selected) + 1
+            print(f"   Clip {clip_data['clip_number']}: {clip_data['start_time']} -> {clip_data['end_time']} | {clip_data['title']}")
+            renders.append(pool.submit(
+                render_clip, video_path, music_path, clip_data, word_timings, word_index, step_progress
+            ))
+            selected.append(clip_data)
+
+        # YouTube metadata normally arrives with the clips; any that came without it
+        # are generated together in one batched request instead of one round-trip per
+        # clip, on this thread while the workers are still encoding
+        missing = [c for c in selected if not _has_metadata(c)]
+        if missing:
+            try:
+                for clip_data, yt_meta in zip(missing, generate_all_clip_assets(missing, video_title)):
+                    clip_data["youtube"] = yt_meta
+            except Exception as e:
+                print(f"  -> Metadata generation failed, using defaults: {e}")
+
+        final_outputs = [r.result() for r in renders]
+
+    for clip_data in selected:
         clip_num = clip_data["clip_number"]
-        start = timestamp_to_seconds(clip_data["start_time"])
-        end = timestamp_to_seconds(clip_data["end_time"])
-
-        # Cut clip from video (9:16 crop)
-        clip_path = cut_clip(video_path, start, end, clip_num)
-        step_progress(f"Clip {clip_num}: Cut video ({end - start:.1f}s)")
-
-        # Mix original audio + background music
-        mixed_path = mix_audio(clip_path, music_path, clip_num)
-
-        # Extract word timings from Whisper that fall in this clip's range
-        clip_word_timings = extract_clip_words(word_timings, start, end)
-        print(f"  -> Found {len(clip_word_timings)} words in clip range")
-
-        # Get the raw transcript text for this clip (fallback for subtitles)
-        clip_text_parts = [w["word"] for w in clip_word_timings]
-        clip_text = " ".join(clip_text_parts) if clip_text_parts else clip_data.get("hook", "")
-
-        # Burn subtitles
-        try:
-            final_path = add_subtitles(mixed_path, clip_text, clip_num, clip_word_timings)
-            if final_path.parent != OUTPUT_DIR:
-                dest = OUTPUT_DIR / f"clip_{clip_num}.mp4"
-                shutil.copy(final_path, dest)
-                final_path = dest
-        except Exception as e:
-            print(f"  -> Subtitle burn failed: {e}")
-            final_path = OUTPUT_DIR / f"clip_{clip_num}.mp4"
-            shutil.copy(mixed_path, final_path)
-
-        final_outputs.append(final_path)
-        step_progress(f"Clip {clip_num}: Subtitles burned")
-
-        gc.collect()
-
-        # Generate YouTube metadata
-        try:
-            yt_meta = generate_youtube_metadata(
-                clip_data.get("title", f"Clip {clip_num}"),
-                clip_data.get("hook", ""),
-                video_title,
-            )
-        except Exception as e:
-            print(f"  -> Metadata generation failed, using defaults: {e}")
-            yt_meta = {
-                "title": clip_data.get("title", f"Clip {clip_num}"),
-                "description": f"#shorts #roblox #gaming",
-                "tags": ["roblox", "gaming", "shorts", "clips"],
-            }
-        step_progress(f"Clip {clip_num}: Generated metadata")
+        yt_meta = clip_data.get("youtube") if _has_metadata(clip_data) else {
+            "title": clip_data.get("title", f"Clip {clip_num}"),
+            "description": f"#shorts #roblox #gaming",
+            "tags": ["roblox", "gaming", "shorts", "clips"],
+        }
+        step_progress(Step.CLIP_METADATA, f"Clip {clip_num}: Generated metadata", clip_num)
 
         clips_metadata.append({
             "clip_number": clip_num,
@@ -160,17 +285,16 @@ def process_video(video_url: str, video_title: str = "Unknown", progress_callbac
             "tags": yt_meta.get("tags", []),
             "hook": clip_data.get("hook", ""),
         })
-        print(f"  -> Clip {clip_num} done: {final_path.name}")
 
     # Cleanup temp files
     cleanup_temp_files()
 
     try:
         if video_path.exists(): video_path.unlink()
-        if audio_path.exists(): audio_path.unlink()
     except Exception:
         pass
 
+    # One full collection per video, once nothing large is still referenced
     gc.collect()
 
     print(f"\n{'='*60}")
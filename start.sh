@@ -10,4 +10,4 @@ else
 fi
 
 echo "Starting YouTube Auto Clipper API..."
-exec uvicorn api:app --host 0.0.0.0 --port 7860
+exec uvicorn api:app --host 0.0.0.0 --port 7860 --loop uvloop --http httptools
@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+])
+def test_parse_range_valid(header, expected):
+    assert api._parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "garbage",
+    "bytes=",
+    "bytes=-",
+    "bytes=abc-def",
+    "bytes=5-1",
+    "bytes=0-1,5-9",
+    "items=0-9",
+])
+def test_parse_range_invalid_is_ignored(header):
+    assert api._parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(api.RangeNotSatisfiable):
+        api._parse_range(header, 1000)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(api, "API_SECRET", "")
+    (tmp_path / "clip.mp4").write_bytes(bytes(range(256)) * 4)
+    return TestClient(api.app)
+
+
+def test_download_suffix_range(client):
+    r = client.get("/download/clip.mp4", headers={"Range": "bytes=-24"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == "bytes 1000-1023/1024"
+    assert r.content == bytes(range(232, 256))
+
+
+def test_download_open_ended_range(client):
+    r = client.get("/download/clip.mp4", headers={"Range": "bytes=1000-"})
+    assert r.status_code == 206
+    assert len(r.content) == 24
+
+
+def test_download_garbage_range_serves_whole_file(client):
+    r = client.get("/download/clip.mp4", headers={"Range": "bytes=oops"})
+    assert r.status_code == 200
+    assert len(r.content) == 1024
+
+
+def test_download_unsatisfiable_range(client):
+    r = client.get("/download/clip.mp4", headers={"Range": "bytes=4096-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == "bytes */1024"
+
+
+@pytest.mark.parametrize("header", [
+    api._ROOT_ETAG,
+    "*",
+    f"W/{api._ROOT_ETAG}",
+    f'"stale", {api._ROOT_ETAG}',
+])
+def test_root_not_modified(client, header):
+    r = client.get("/", headers={"If-None-Match": header})
+    assert r.status_code == 304
+    assert r.headers["etag"] == api._ROOT_ETAG
+
+
+@pytest.mark.parametrize("header", ['"stale"', 'W/"stale", "other"'])
+def test_root_modified(client, header):
+    r = client.get("/", headers={"If-None-Match": header})
+    assert r.status_code == 200
+    assert r.content == api._ROOT_BYTES
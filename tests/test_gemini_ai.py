@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+import gemini_ai
+
+_CLIPS_JSON = (
+    '[{"clip_number": 1, "start_time": "00:10", "end_time": "00:50", '
+    '"title": "Big win", "reason": "payoff", "hook": "Watch this"}]'
+)
+
+
+class _FakeGroq:
+    """Streams a canned completion in small chunks and counts API calls."""
+
+    def __init__(self, text: str):
+        self.calls = 0
+        self.text = text
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        chunks = [self.text[i:i + 7] for i in range(0, len(self.text), 7)]
+        return iter(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=c))]) for c in chunks)
+
+
+@pytest.fixture
+def ai_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "AI_CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "AI_CACHE_PATH", tmp_path / "ai_cache.db")
+    monkeypatch.setattr(cache, "_conn", None)
+    monkeypatch.setattr(cache, "_memory", OrderedDict())
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    fake = _FakeGroq(_CLIPS_JSON)
+    monkeypatch.setattr(gemini_ai, "_groq", lambda: fake)
+    monkeypatch.setattr(gemini_ai, "_router", gemini_ai.LLMRouter(["groq"]))
+    return fake
+
+
+def test_cached_clip_selection_calls_the_api_once(ai_cache, fake_groq):
+    first = list(gemini_ai.iter_best_clips("[00:00 - 01:00] hello", "Video", force_cache=True))
+    second = list(gemini_ai.iter_best_clips("[00:00 - 01:00] hello", "Video", force_cache=True))
+
+    assert fake_groq.calls == 1
+    assert first == second
+    assert first[0]["title"] == "Big win"
+
+
+def test_uncached_clip_selection_calls_the_api_each_time(ai_cache, fake_groq):
+    list(gemini_ai.iter_best_clips("[00:00 - 01:00] hello", "Video", force_cache=False))
+    list(gemini_ai.iter_best_clips("[00:00 - 01:00] hello", "Video", force_cache=False))
+
+    assert fake_groq.calls == 2
+
+
+@pytest.mark.parametrize("ts, expected", [("01:05", 65.0), ("1:05", 65.0), ("00:01:05", 65.0), ("1:2:3", 3723.0)])
+def test_timestamp_to_seconds_returns_float(ts, expected):
+    seconds = gemini_ai.timestamp_to_seconds(ts)
+    assert seconds == expected and isinstance(seconds, float)
+
+
+@pytest.mark.parametrize("ts", ["", "soon", "1:xx", "01:05:06:07", "12::3", "12:3:", "12:3::45"])
+def test_timestamp_to_seconds_rejects_garbage(ts):
+    with pytest.raises(ValueError):
+        gemini_ai.timestamp_to_seconds(ts)
@@ -0,0 +1,17 @@
+from video_processor import create_clip_ass
+
+
+def _events(path):
+    return [line.split(",,", 2)[-1] for line in path.read_text(encoding="utf-8").splitlines()
+            if line.startswith("Dialogue:")]
+
+
+def test_braced_word_is_shown_literally(tmp_path):
+    timings = [{"word": "{wow}", "start_ms": 0, "end_ms": 400}, {"word": "ok", "start_ms": 400, "end_ms": 800}]
+    out = create_clip_ass("", tmp_path / "sub.ass", timings)
+    assert _events(out) == ["\\{WOW\\}", "OK"]
+
+
+def test_backslash_cannot_form_an_override(tmp_path):
+    out = create_clip_ass("a\\n b", tmp_path / "sub.ass")
+    assert _events(out) == ["A\\\u2060N B"]
@@ -1,4 +1,9 @@
+import hashlib
+import os
+import shutil
 import subprocess
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 from config import (
@@ -12,225 +17,245 @@ from config import (
     MUSIC_VOLUME,
     OUTPUT_WIDTH,
     OUTPUT_HEIGHT,
-    SUBTITLE_STYLE,
+    SUBTITLE_FORCE_STYLE,
+    SUBTITLE_STYLE_ASS_LINE,
+    VIDEO_HW_ENCODER,
+    FFMPEG_THREADS,
+    FFMPEG,
 )
 
 
-def cut_clip(video_path: Path, start_seconds: float, end_seconds: float, clip_index: int) -> Path:
-    """Extract a clip and crop to 9:16 vertical."""
-    output_path = CLIPS_DIR / f"clip_{clip_index}.mp4"
-    duration = end_seconds - start_seconds
-
-    # Crop center to 9:16 aspect ratio, then scale to output resolution
-    vf = (
-        f"crop=ih*9/16:ih,"
-        f"scale={OUTPUT_WIDTH}:{OUTPUT_HEIGHT}"
-    )
+# Errors only: x264 progress lines would otherwise stream tens of MB through the pipe
+FFMPEG_QUIET = ["-hide_banner", "-loglevel", "error", "-nostats"]
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-ss", str(start_seconds),
-        "-i", str(video_path),
-        "-t", str(duration),
-        "-vf", vf,
-        "-c:v", VIDEO_CODEC,
-        "-c:a", "aac",
-        "-preset", VIDEO_PRESET,
-        "-crf", VIDEO_CRF,
-        str(output_path),
-    ]
 
-    print(f"[FFMPEG] Cutting 9:16 clip {clip_index}: {start_seconds}s -> {end_seconds}s ({duration:.1f}s)")
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg cut failed: {result.stderr[-500:]}")
+def run_ffmpeg(cmd: list[str], action: str):
+    """Run ffmpeg, draining stderr as it comes and keeping only its tail for the error message."""
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    tail = deque(proc.stderr, maxlen=64)
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg {action} failed: {b''.join(tail).decode(errors='replace')[-500:]}")
 
-    return output_path
 
+# Hardware H.264 encoders in order of preference, with quality settings roughly
+# matching VIDEO_CRF on libx264
+_HW_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr", "-cq", VIDEO_CRF, "-b:v", "0"],
+    "h264_videotoolbox": ["-q:v", "65"],
+    "h264_qsv": ["-preset", VIDEO_PRESET, "-global_quality", VIDEO_CRF],
+}
 
-def mix_audio(clip_path: Path, music_path: Path | None, clip_index: int) -> Path:
-    """Mix original clip audio + background music (no voiceover)."""
-    if not music_path or not music_path.exists():
-        return clip_path  # No music to mix, return clip as-is
 
-    output_path = CLIPS_DIR / f"mixed_{clip_index}.mp4"
+@lru_cache(maxsize=None)
+def _ffmpeg_capabilities(kind: str) -> frozenset[str]:
+    """Names from `ffmpeg -encoders` / `-filters`, listed once per process.
 
+    Rows look like " V....D libx264  description"; the name is the second column.
+    """
     try:
-        probe_cmd = [
-            "ffprobe", "-v", "error", "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1", str(clip_path)
-        ]
-        duration_str = subprocess.check_output(probe_cmd, text=True).strip()
-        duration = float(duration_str)
-    except Exception:
-        duration = 60.0
-
-    fade_start = max(0, duration - 5)
-
-    filter_complex = (
-        f"[0:a]volume={ORIGINAL_AUDIO_VOLUME}[orig];"
-        f"[1:a]volume={MUSIC_VOLUME},afade=t=out:st={fade_start}:d=5[music];"
-        f"[orig][music]amix=inputs=2:duration=first:dropout_transition=2[aout]"
-    )
+        out = subprocess.run([FFMPEG, "-hide_banner", f"-{kind}"], capture_output=True, text=True).stdout
+    except OSError:
+        print(f"[FFMPEG] ffmpeg not found, assuming no {kind}")
+        return frozenset()
+    return frozenset(cols[1] for cols in map(str.split, out.splitlines()) if len(cols) >= 3)
 
+
+def has_encoder(name: str) -> bool:
+    return name in _ffmpeg_capabilities("encoders")
+
+
+def has_filter(name: str) -> bool:
+    return name in _ffmpeg_capabilities("filters")
+
+
+def _encoder_works(encoder: str) -> bool:
+    """A build can list an encoder without the GPU/driver behind it, so try a tiny encode."""
     cmd = [
-        "ffmpeg", "-y",
-        "-i", str(clip_path),
-        "-i", str(music_path),
-        "-filter_complex", filter_complex,
-        "-map", "0:v",
-        "-map", "[aout]",
-        "-c:v", "copy",
-        "-c:a", "aac",
-        "-b:a", AUDIO_BITRATE,
-        str(output_path),
+        FFMPEG, *FFMPEG_QUIET,
+        "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+        "-c:v", encoder, "-f", "null", "-",
     ]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=15).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@lru_cache(maxsize=None)
+def pick_video_encoder() -> str:
+    """Encoder for every clip render: VIDEO_HW_ENCODER, or in "auto" the first working hardware one."""
+    if VIDEO_HW_ENCODER in ("off", "none", ""):
+        return VIDEO_CODEC
+    candidates = list(_HW_ENCODERS) if VIDEO_HW_ENCODER == "auto" else [VIDEO_HW_ENCODER]
+    for encoder in candidates:
+        if has_encoder(encoder) and _encoder_works(encoder):
+            print(f"[FFMPEG] Using hardware encoder {encoder}")
+            return encoder
+    print(f"[FFMPEG] No hardware encoder available, using {VIDEO_CODEC}")
+    return VIDEO_CODEC
+
+
+# Decoders on the same device as the picked encoder. Frames come back to system memory
+# (no -hwaccel_output_format) because crop/scale/ass run on the CPU; ffmpeg falls back
+# to software decode on its own if the hwaccel can't initialise.
+_HW_DECODERS = {
+    "h264_nvenc": "cuda",
+    "h264_videotoolbox": "videotoolbox",
+}
+
+
+def video_dec_args() -> list[str]:
+    """Input options for hardware decoding, matching the encoder pick_video_encoder chose."""
+    hwaccel = _HW_DECODERS.get(pick_video_encoder())
+    return ["-hwaccel", hwaccel] if hwaccel else []
+
+
+def video_enc_args() -> list[str]:
+    """-c:v plus the quality/speed flags for the picked encoder."""
+    encoder = pick_video_encoder()
+    threads = ["-threads", str(FFMPEG_THREADS)]
+    if encoder in _HW_ENCODERS:
+        return ["-c:v", encoder, *_HW_ENCODERS[encoder], *threads]
+    return ["-c:v", encoder, "-preset", VIDEO_PRESET, "-crf", VIDEO_CRF, *threads]
+
+
+# Clip audio ducked under the music, which fades out over the last 5 s; only the fade
+# start varies per clip
+_MUSIC_MIX = (
+    f"[0:a]volume={ORIGINAL_AUDIO_VOLUME}[orig];"
+    f"[1:a]volume={MUSIC_VOLUME},afade=t=out:st={{fade_start}}:d=5[music];"
+    f"[orig][music]amix=inputs=2:duration=first:dropout_transition=2[aout]"
+)
 
-    print(f"[FFMPEG] Mixing audio + music for clip {clip_index} (Duration: {duration:.1f}s)")
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg mix failed: {result.stderr[-500:]}")
 
-    return output_path
+# Style pre-baked into the file: libass reads it directly instead of converting SRT
+# and re-parsing force_style for every clip. PlayRes matches ffmpeg's SRT conversion,
+# so font sizes look the same as on the force_style path.
+_ASS_HEADER = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "PlayResX: 384\n"
+    "PlayResY: 288\n"
+    "ScaledBorderAndShadow: yes\n"
+    "\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+    "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+    f"{SUBTITLE_STYLE_ASS_LINE}\n"
+    "\n"
+    "[Events]\n"
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
 
 
-def create_word_srt(word_timings: List[dict], output_path: Path,
-                    delay_ms: int = 0) -> Path:
-    """Create word-by-word SRT subtitles from speech transcription.
+def _ass_time(ms: int) -> str:
+    cs = ms // 10
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
 
-    Each word gets its own subtitle entry, displayed one at a time in uppercase.
-    """
-    def ms_to_srt_time(ms: int) -> str:
-        hours = ms // 3600000
-        ms %= 3600000
-        minutes = ms // 60000
-        ms %= 60000
-        seconds = ms // 1000
-        millis = ms % 1000
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
 
-    srt_lines = []
-    index = 1
+# Cue text is literal: "{" would open an override block and "\N"/"\h" are line
+# breaks/spaces to libass, so braces are escaped and each backslash gets a word joiner
+# after it, which stops it from pairing with the next character.
+_ASS_TEXT_ESCAPE = str.maketrans({"\\": "\\\u2060", "{": "\\{", "}": "\\}"})
+
 
-    for timing in word_timings:
-        word = timing["word"].strip().upper()
-        if not word:
-            continue
+def create_clip_ass(subtitle_text: str, output_path: Path, word_timings: List[dict] = None) -> Path | None:
+    """ASS subtitles for a clip in the selected style; None if there's nothing to show.
 
-        start_ms = timing["start_ms"] + delay_ms
-        end_ms = timing["end_ms"] + delay_ms
+    Word-by-word (uppercase, at least 150 ms each) when timings exist; otherwise
+    5-word chunks of the text, 4 seconds each.
+    """
+    cues = []
+    if word_timings:
+        for timing in word_timings:
+            word = timing["word"].strip().upper()
+            if word:
+                cues.append((timing["start_ms"], max(timing["end_ms"], timing["start_ms"] + 150), word))
+    else:
+        words = subtitle_text.replace("\n", " ").replace("\"", "'").strip().upper().split()
+        for i in range(0, len(words), 5):
+            cues.append((i // 5 * 4000, (i // 5 + 1) * 4000, " ".join(words[i:i+5])))
+    if not cues:
+        return None
+
+    events = "".join(
+        f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{text.translate(_ASS_TEXT_ESCAPE)}\n"
+        for start, end, text in cues
+    )
+    output_path.write_text(_ASS_HEADER + events, encoding="utf-8")
+    print(f"[SUBTITLES] Generated ASS with {len(cues)} cues")
+    return output_path
 
-        if end_ms - start_ms < 150:
-            end_ms = start_ms + 150
 
-        start_t = ms_to_srt_time(start_ms)
-        end_t = ms_to_srt_time(end_ms)
+def write_clip_subtitles(subtitle_text: str, clip_index: int, word_timings: List[dict] = None) -> Path | None:
+    return create_clip_ass(subtitle_text, CLIPS_DIR / f"sub_{clip_index}.ass", word_timings)
 
-        srt_lines.append(f"{index}\n{start_t} --> {end_t}\n{word}\n")
-        index += 1
 
-    srt_content = "\n".join(srt_lines)
-    output_path.write_text(srt_content, encoding="utf-8")
+def _subtitles_filter(srt_path: Path) -> str:
+    srt_escaped = str(srt_path).replace("\\", "/").replace(":", r"\:")
+    if srt_path.suffix == ".ass":
+        # Styled already; the ass filter skips the SRT conversion and force_style
+        return f"ass='{srt_escaped}'"
+    return f"subtitles='{srt_escaped}':force_style='{SUBTITLE_FORCE_STYLE}'"
 
-    print(f"[SUBTITLES] Generated SRT with {index - 1} words")
-    return output_path
 
+def render_final_clip(video_path: Path, start_seconds: float, end_seconds: float,
+                      music_path: Path | None, subs_path: Path | None, clip_index: int) -> Path:
+    """cut_clip + mix_audio + burn_subtitles as one ffmpeg pass: one decode, one x264 encode.
 
-def burn_subtitles(input_video: Path, srt_path: Path, clip_index: int,
-                   style: dict = None) -> Path:
-    """Burn subtitles onto video using force_style."""
+    Writes OUTPUT_DIR/final_clip_N.mp4 with no intermediate files. Without music the
+    original audio is kept as-is; without `subs_path` (.ass or .srt) no subtitles are burned.
+    """
     output_path = OUTPUT_DIR / f"final_clip_{clip_index}.mp4"
-    if style is None:
-        style = SUBTITLE_STYLE
-
-    force_style = (
-        f"FontName={style['font']},"
-        f"FontSize={style['font_size']},"
-        f"PrimaryColour={style['primary_color']},"
-        f"OutlineColour={style['outline_color']},"
-        f"BackColour={style['back_color']},"
-        f"BorderStyle=1,"
-        f"Outline={style['outline']},"
-        f"Shadow={style['shadow']},"
-        f"Bold={style['bold']},"
-        f"Alignment={style['alignment']},"
-        f"MarginV={style['margin_v']}"
-    )
+    duration = end_seconds - start_seconds
 
-    srt_escaped = str(srt_path).replace("\\", "/").replace(":", r"\:")
-    subtitle_filter = f"subtitles='{srt_escaped}':force_style='{force_style}'"
+    vf = f"crop=ih*9/16:ih,scale={OUTPUT_WIDTH}:{OUTPUT_HEIGHT}"
+    if subs_path and not has_filter("ass" if subs_path.suffix == ".ass" else "subtitles"):
+        print(f"[WARN] ffmpeg was built without libass, rendering clip {clip_index} without subtitles")
+        subs_path = None
+    if subs_path:
+        vf += "," + _subtitles_filter(subs_path)
+    graph = [f"[0:v]{vf}[vout]"]
+
+    # Input-side -ss/-t: fast seek, and only the clip's span is ever decoded
+    inputs = [*video_dec_args(), "-ss", str(start_seconds), "-t", str(duration), "-i", str(video_path)]
+    audio_map = "0:a?"
+    if music_path and music_path.exists():
+        fade_start = max(0, duration - 5)
+        inputs += ["-i", str(music_path)]
+        graph.append(_MUSIC_MIX.format(fade_start=fade_start))
+        audio_map = "[aout]"
 
     cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_video),
-        "-vf", subtitle_filter,
-        "-c:v", VIDEO_CODEC,
-        "-c:a", "copy",
-        "-preset", VIDEO_PRESET,
-        "-crf", VIDEO_CRF,
+        FFMPEG, "-y", *FFMPEG_QUIET,
+        *inputs,
+        "-filter_complex", ";".join(graph),
+        "-map", "[vout]",
+        "-map", audio_map,
+        *video_enc_args(),
+        "-c:a", "aac",
+        "-b:a", AUDIO_BITRATE,
         str(output_path),
     ]
 
-    print(f"[FFMPEG] Burning subtitles for clip {clip_index}")
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg subtitle burn failed: {result.stderr[-500:]}")
+    print(f"[FFMPEG] Rendering clip {clip_index} in one pass: {start_seconds}s -> {end_seconds}s "
+          f"({duration:.1f}s, music={'yes' if audio_map == '[aout]' else 'no'}, subtitles={'yes' if subs_path else 'no'})")
+    run_ffmpeg(cmd, "render")
 
     return output_path
 
 
-def add_subtitles(video_path: Path, subtitle_text: str, clip_index: int,
-                  word_timings: List[dict] = None) -> Path:
-    """Burn subtitles onto the video.
-
-    Strategy 1: Word-by-word SRT with force_style (if word timings available)
-    Strategy 2: Chunked SRT fallback (if no timings)
-    Strategy 3: Return video without subtitles (failsafe)
-    """
-    # Strategy 1: Word-by-word SRT with force_style
-    if word_timings and len(word_timings) > 0:
-        try:
-            print(f"[FFMPEG] Burning word-by-word subtitles for clip {clip_index}")
-            srt_path = CLIPS_DIR / f"sub_{clip_index}.srt"
-            create_word_srt(word_timings, srt_path, delay_ms=0)
-            return burn_subtitles(video_path, srt_path, clip_index)
-        except Exception as e:
-            print(f"[WARN] Word-by-word subtitle burn failed: {e}, trying fallback")
-
-    # Strategy 2: Chunked SRT fallback
-    try:
-        print(f"[FFMPEG] Burning chunked subtitles for clip {clip_index}")
-        clean_text = subtitle_text.replace("\n", " ").replace("\"", "'").strip().upper()
-
-        srt_path = CLIPS_DIR / f"sub_{clip_index}.srt"
-        words = clean_text.split()
-        chunks = [" ".join(words[i:i+5]) for i in range(0, len(words), 5)]
-        srt_lines = []
-        for i, chunk in enumerate(chunks):
-            start_s = i * 4
-            end_s = (i + 1) * 4
-            h_s, m_s, s_s = start_s // 3600, (start_s % 3600) // 60, start_s % 60
-            h_e, m_e, s_e = end_s // 3600, (end_s % 3600) // 60, end_s % 60
-            start_t = f"{h_s:02d}:{m_s:02d}:{s_s:02d},000"
-            end_t = f"{h_e:02d}:{m_e:02d}:{s_e:02d},000"
-            srt_lines.append(f"{i+1}\n{start_t} --> {end_t}\n{chunk}\n")
-
-        srt_content = "\n".join(srt_lines)
-        srt_path.write_text(srt_content, encoding="utf-8")
-
-        return burn_subtitles(video_path, srt_path, clip_index)
-    except Exception as e:
-        print(f"[WARN] SRT fallback failed: {e}")
-
-    # Strategy 3: Return video without subtitles
-    print("[WARN] All subtitle methods failed, returning video without subtitles")
-    return video_path
+def store_content_addressed(path: Path) -> Path:
+    """Rename a finished clip to OUTPUT_DIR/<blake2b>.mp4 so identical renders share one file."""
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+    dest = OUTPUT_DIR / f"{digest}{path.suffix}"
+    os.replace(path, dest)
+    return dest
 
 
 def cleanup_temp_files():
-    """Remove intermediate files from clips directory."""
-    for f in CLIPS_DIR.glob("*"):
-        try:
-            f.unlink()
-        except Exception:
-            pass
+    """Remove intermediate files (and any stray subdirectories) from the clips directory."""
+    shutil.rmtree(CLIPS_DIR, ignore_errors=True)
+    CLIPS_DIR.mkdir(parents=True, exist_ok=True)